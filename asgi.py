@@ -0,0 +1,184 @@
+"""ASGI entrypoint, run with `uvicorn asgi:app`.
+
+The Steam-bound routes are served on the event loop with the async twins in
+`steam.aio`, so a slow Steam call only parks a coroutine. Store and cache
+access, which can wait on SQLite or file locks, runs in threads. Every other
+route is handed to the regular Flask WSGI app through a2wsgi.
+"""
+
+import asyncio
+import io
+import logging
+import sys
+
+import htpy as h
+from a2wsgi import WSGIMiddleware
+from flask import redirect, request, session, url_for
+from werkzeug.exceptions import HTTPException
+
+import steam as steam_api
+from components import error_loading_games_warning, private_profile_message
+from run import app as flask_app
+from run import (
+    cached_steam_friends,
+    common_games_party,
+    finish_login,
+    friends_refresh_poll,
+    render_common_games,
+    render_friends_page,
+    store_steam_friends,
+    warm_start,
+)
+from steam import aio
+from steam.client import aclose_async_client
+
+
+async def load_friends():
+    steam_id = session.get("steam_id")
+    if not steam_id:
+        return redirect(url_for("index"))
+
+    poll = await asyncio.to_thread(friends_refresh_poll, steam_id)
+    if poll:
+        return poll
+
+    friends = await asyncio.to_thread(cached_steam_friends, steam_id)
+    if friends is None:
+        try:
+            friends = await aio.get_steam_friends_from_api(steam_id)
+        except steam_api.SteamProfileNotPublic:
+            return str(private_profile_message())
+        await asyncio.to_thread(store_steam_friends, steam_id, friends)
+
+    user_details = await aio.get_user_details(steam_id)
+    return await asyncio.to_thread(render_friends_page, steam_id, friends, user_details)
+
+
+async def load_common_games():
+    if not request.args.get("friend_ids") and not request.args.get("share_data"):
+        return str(h.p["No friends selected."])
+
+    try:
+        all_user_ids = await asyncio.to_thread(common_games_party)
+        ranked_games = await aio.rank_common_games(all_user_ids, len(all_user_ids))
+        return await asyncio.to_thread(render_common_games, all_user_ids, ranked_games)
+    except Exception as e:
+        logging.error("Error fetching common games", extra={"exception": str(e)})
+        return str(error_loading_games_warning())
+
+
+async def authorize():
+    steam_id = await aio.validate_steam_login()
+    return await asyncio.to_thread(finish_login, steam_id)
+
+
+ASYNC_VIEWS = {
+    "load_friends": load_friends,
+    "load_common_games": load_common_games,
+    "authorize": authorize,
+}
+
+wsgi_app = WSGIMiddleware(flask_app)
+
+
+def build_environ(scope: dict) -> dict:
+    """The WSGI environ of a bodiless ASGI HTTP request, per PEP 3333."""
+    script_name = scope.get("root_path", "").encode().decode("latin1")
+    path_info = scope["path"].encode().decode("latin1")
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name) :]
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": script_name,
+        "PATH_INFO": path_info,
+        "QUERY_STRING": scope["query_string"].decode("latin1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+
+    for name, value in scope["headers"]:
+        key = name.decode("latin1").upper().replace("-", "_")
+        if key not in ("CONTENT_LENGTH", "CONTENT_TYPE"):
+            key = "HTTP_" + key
+        value = value.decode("latin1")
+        if key in environ:
+            separator = "; " if key == "HTTP_COOKIE" else ","
+            value = environ[key] + separator + value
+        environ[key] = value
+    return environ
+
+
+def async_endpoint(environ: dict) -> str | None:
+    try:
+        endpoint, _ = flask_app.url_map.bind_to_environ(environ).match()
+    except HTTPException:
+        return None
+    return endpoint if endpoint in ASYNC_VIEWS else None
+
+
+async def dispatch(environ: dict, endpoint: str):
+    """Mirror `Flask.full_dispatch_request` for an async view."""
+    with flask_app.request_context(environ):
+        try:
+            try:
+                rv = flask_app.preprocess_request()
+                if rv is None:
+                    rv = await ASYNC_VIEWS[endpoint]()
+            except Exception as e:
+                rv = flask_app.handle_user_exception(e)
+            return flask_app.finalize_request(rv)
+        except Exception as e:
+            return flask_app.handle_exception(e)
+
+
+async def lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await asyncio.to_thread(warm_start)
+            except Exception:
+                logging.exception("Warm start failed")
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await aclose_async_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+
+    if scope["type"] != "http" or scope["method"] != "GET":
+        return await wsgi_app(scope, receive, send)
+
+    environ = build_environ(scope)
+    endpoint = async_endpoint(environ)
+    if endpoint is None:
+        return await wsgi_app(scope, receive, send)
+
+    response = await dispatch(environ, endpoint)
+    await send(
+        {
+            "type": "http.response.start",
+            "status": response.status_code,
+            "headers": [
+                (key.lower().encode("latin1"), value.encode("latin1"))
+                for key, value in response.headers.items()
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": response.get_data()})
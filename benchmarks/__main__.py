@@ -0,0 +1,167 @@
+"""Benchmark `steam` and the Flask routes against a local fake Steam.
+
+    python -m benchmarks --parties 2,5,10,20 --games 10,1000,10000
+
+Every scenario is run cold (empty store and caches) and then warm, and
+reports latency percentiles, outbound Steam calls and peak Python memory.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+
+# Configure the app before it is imported: no rate limiting, throwaway store
+_workdir = tempfile.mkdtemp(prefix="wcwp-bench-")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ["STEAM_RATE_LIMIT"] = "1000000"
+os.environ["STEAM_RATE_LIMIT_BURST"] = "1000000"
+os.environ["STEAM_RATE_LIMIT_FILE"] = os.path.join(_workdir, "bucket")
+os.environ["STEAM_STORE_PATH"] = os.path.join(_workdir, "steam.sqlite3")
+
+import run  # noqa: E402
+import steam  # noqa: E402
+from benchmarks.fake_steam import FakeSteam  # noqa: E402
+from caching import cache  # noqa: E402
+from components import _friend_row, _game_row  # noqa: E402
+from steam import store  # noqa: E402
+from steam.catalog import apps  # noqa: E402
+from steam.prefetch import cancel_prefetch  # noqa: E402
+
+
+def _ints(value: str) -> list[int]:
+    return [int(part) for part in value.split(",")]
+
+
+def _percentile(samples: list[float], percent: float) -> float:
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _reset_caches() -> None:
+    with store.connection() as conn:
+        for table in ("players", "libraries", "owned_games", "apps", "prices"):
+            conn.execute(f"DELETE FROM {table}")
+    cache.clear()
+    steam.price_cache.clear()
+    apps.clear()
+    _friend_row.cache_clear()
+    _game_row.cache_clear()
+
+
+def _measure(fake: FakeSteam, fn: Callable[[], object], repeat: int, cold: bool):
+    if not cold:
+        fn()
+    timings = []
+    fake.reset_calls()
+    tracemalloc.start()
+    for _ in range(repeat):
+        if cold:
+            _reset_caches()
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return timings, sum(fake.calls.values()) / repeat, peak
+
+
+def _report(name: str, timings: list[float], calls: float, peak: int) -> None:
+    p50, p95, p99 = (_percentile(timings, p) * 1000 for p in (50, 95, 99))
+    print(
+        f"{name:<48} p50 {p50:8.1f}ms  p95 {p95:8.1f}ms  p99 {p99:8.1f}ms"
+        f"  calls {calls:7.1f}  peak {peak / 2**20:7.1f}MiB"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--parties", type=_ints, default=[2, 5, 10, 20])
+    parser.add_argument("--games", type=_ints, default=[10, 1_000, 10_000])
+    parser.add_argument("--friends", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--limit", type=int, default=None, help="top games priced by get_common_games"
+    )
+    args = parser.parse_args()
+
+    fake = FakeSteam(latency=args.latency, friends=args.friends).start()
+    steam.STEAM_API_URL = f"{fake.url}/ISteamUser"
+    steam.STEAM_PLAYER_SERVICE_URL = f"{fake.url}/IPlayerService"
+    steam.STEAM_APP_DETAILS_URL = f"{fake.url}/api/appdetails"
+
+    run.app.config["CACHE_DIR"] = os.path.join(_workdir, "cache")
+    cache.init_app(run.app)
+
+    host = fake.steam_id(0)
+    client = run.app.test_client()
+    with client.session_transaction() as session:
+        session["steam_id"] = host
+
+    def load_friends() -> None:
+        response = client.get("/load-friends")
+        # Keep the background prefetch out of the call counts
+        cancel_prefetch(host)
+        assert response.status_code == 200, response.status_code
+
+    try:
+        with run.app.app_context():
+            for cold in (True, False):
+                label = "cold" if cold else "warm"
+                _reset_caches()
+                _report(
+                    f"get_steam_friends_from_api {label}",
+                    *_measure(
+                        fake,
+                        lambda: steam.get_steam_friends_from_api(host),
+                        args.repeat,
+                        cold,
+                    ),
+                )
+                _report(
+                    f"GET /load-friends {label}",
+                    *_measure(fake, load_friends, args.repeat, cold),
+                )
+
+            for games in args.games:
+                fake.games = games
+                for party_size in args.parties:
+                    party = [fake.steam_id(index) for index in range(party_size)]
+                    friend_ids = ",".join(party[1:])
+
+                    def load_common_games() -> None:
+                        response = client.get(
+                            "/load-common-games",
+                            query_string={"friend_ids": friend_ids},
+                        )
+                        assert response.status_code == 200, response.status_code
+
+                    for cold in (True, False):
+                        label = f"{party_size} users x {games} games {'cold' if cold else 'warm'}"
+                        _reset_caches()
+                        _report(
+                            f"get_common_games {label}",
+                            *_measure(
+                                fake,
+                                lambda: steam.get_common_games(
+                                    party, len(party), limit=args.limit
+                                ),
+                                args.repeat,
+                                cold,
+                            ),
+                        )
+                        _reset_caches()
+                        _report(
+                            f"GET /load-common-games {label}",
+                            *_measure(fake, load_common_games, args.repeat, cold),
+                        )
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
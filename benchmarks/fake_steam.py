@@ -0,0 +1,152 @@
+"""A local stand-in for the Steam Web API and store API.
+
+Serves synthetic, deterministic responses for the endpoints `steam` calls,
+after an optional per-call latency, and counts every call per endpoint.
+"""
+
+import json
+import random
+import threading
+import time
+from collections import Counter
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+STEAM_ID_BASE = 76561197960265728
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args): ...
+
+
+class FakeSteam:
+    """Synthetic Steam data: `friends` per user and `games` per library.
+
+    Libraries are drawn from a pool of `games * 1.5` appids so parties share
+    a realistic chunk of their games.
+    """
+
+    def __init__(self, latency: float = 0.05, friends: int = 50, games: int = 100):
+        self.latency = latency
+        self.friends = friends
+        self.games = games
+        self.calls: Counter[str] = Counter()
+        self._lock = threading.Lock()
+        self._server: WSGIServer | None = None
+
+    @property
+    def url(self) -> str:
+        assert self._server is not None
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeSteam":
+        self._server = make_server(
+            "127.0.0.1",
+            0,
+            self,
+            server_class=_ThreadingWSGIServer,
+            handler_class=_QuietHandler,
+        )
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def reset_calls(self) -> None:
+        with self._lock:
+            self.calls.clear()
+
+    def steam_id(self, index: int) -> str:
+        return str(STEAM_ID_BASE + index)
+
+    def library(self, steam_id: str) -> list[int]:
+        rng = random.Random(steam_id)
+        pool = range(10, int(self.games * 1.5) * 10 + 10, 10)
+        return sorted(rng.sample(pool, self.games))
+
+    def __call__(self, environ, start_response):
+        path = environ["PATH_INFO"]
+        query = {
+            key: values[-1] for key, values in parse_qs(environ["QUERY_STRING"]).items()
+        }
+        endpoint = path.rstrip("/").split("/")[-2 if "/v" in path else -1]
+        with self._lock:
+            self.calls[endpoint] += 1
+
+        time.sleep(self.latency)
+        handler = getattr(self, f"_{endpoint.lower()}", None)
+        if handler is None:
+            start_response("404 Not Found", [("Content-Type", "text/plain")])
+            return [b"not found"]
+
+        body = json.dumps(handler(query)).encode()
+        start_response("200 OK", [("Content-Type", "application/json")])
+        return [body]
+
+    def _getfriendlist(self, query: dict) -> dict:
+        offset = int(query["steamid"]) - STEAM_ID_BASE
+        return {
+            "friendslist": {
+                "friends": [
+                    {"steamid": self.steam_id(offset + index + 1)}
+                    for index in range(self.friends)
+                ]
+            }
+        }
+
+    def _getplayersummaries(self, query: dict) -> dict:
+        return {
+            "response": {
+                "players": [
+                    {
+                        "steamid": steam_id,
+                        "personaname": f"player{int(steam_id) - STEAM_ID_BASE}",
+                        "avatar": f"https://avatars.invalid/{steam_id}.jpg",
+                        "communityvisibilitystate": 3,
+                    }
+                    for steam_id in query["steamids"].split(",")
+                ]
+            }
+        }
+
+    def _getownedgames(self, query: dict) -> dict:
+        appids = self.library(query["steamid"])
+        appids_filter = {
+            int(value)
+            for key, value in query.items()
+            if key.startswith("appids_filter")
+        }
+        if appids_filter:
+            appids = [appid for appid in appids if appid in appids_filter]
+
+        include_appinfo = query.get("include_appinfo") in ("true", "True", "1")
+        games = []
+        for appid in appids:
+            game = {"appid": appid, "playtime_forever": appid % 997}
+            if include_appinfo:
+                game["name"] = f"Game {appid}"
+                game["img_icon_url"] = f"{appid:040x}"
+            games.append(game)
+        return {"response": {"game_count": len(games), "games": games}}
+
+    def _appdetails(self, query: dict) -> dict:
+        return {
+            appid: {
+                "success": True,
+                "data": {
+                    "price_overview": {
+                        "final_formatted": f"{int(appid) % 60 + 0.99:.2f}€"
+                    }
+                },
+            }
+            for appid in query["appids"].split(",")
+        }
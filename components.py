@@ -1,16 +1,21 @@
-import base64
-import json
+from functools import lru_cache
 
 import htpy as h
 from flask import url_for
+from markupsafe import Markup
 
+import metrics
+from sharing import encode_party
 
-def base_layout(content, container_width="800px"):
-    container_class = (
-        "container" if container_width == "800px" else "container container--narrow"
-    )
+# Rendered rows are cached as Markup, keyed by everything they display
+FRIEND_ROW_CACHE_SIZE = 10_000
+GAME_ROW_CACHE_SIZE = 10_000
 
-    return h.html(data_theme="dark")[
+
+@lru_cache(maxsize=1)
+def _head() -> Markup:
+    # Identical on every page, so it's rendered once per process
+    return Markup(
         h.head[
             h.meta(charset="utf-8"),
             h.meta(name="viewport", content="width=device-width, initial-scale=1"),
@@ -33,7 +38,18 @@ def base_layout(content, container_width="800px"):
                 src="https://cdn.jsdelivr.net/npm/alpinejs@3.x.x/dist/cdn.min.js",
             ),
             h.script(src="https://unpkg.com/htmx.org@2.0.3"),
-        ],
+            h.script(src="https://unpkg.com/htmx-ext-sse@2.2.2/sse.js"),
+        ]
+    )
+
+
+def base_layout(content, container_width="800px"):
+    container_class = (
+        "container" if container_width == "800px" else "container container--narrow"
+    )
+
+    return h.html(data_theme="dark")[
+        _head(),
         h.body[
             h.div(class_=container_class)[
                 h.main(id="main-content")[
@@ -59,43 +75,46 @@ def load_friends_content() -> h.Element:
     )[loading_spinner("Loading your friends...")]
 
 
-def login_page():
-    return base_layout(
-        h.div[
-            h.p(".intro-text")[
-                "Sign in with your Steam account to find games you can play with your friends."
-            ],
-            h.a(
-                ".steam-btn",
-                href=url_for("login"),
-                **{
-                    "onmousemove": """
+@lru_cache(maxsize=1)
+def login_page() -> Markup:
+    return Markup(
+        base_layout(
+            h.div[
+                h.p(".intro-text")[
+                    "Sign in with your Steam account to find games you can play with your friends."
+                ],
+                h.a(
+                    ".steam-btn",
+                    href=url_for("login"),
+                    **{
+                        "onmousemove": """
                         const rect = this.getBoundingClientRect();
                         const x = ((event.clientX - rect.left) / rect.width) * 100;
                         const y = ((event.clientY - rect.top) / rect.height) * 100;
                         this.style.setProperty('--mouse-x', x + '%');
                         this.style.setProperty('--mouse-y', y + '%');
                     """,
-                    "onmouseleave": """
+                        "onmouseleave": """
                         this.style.setProperty('--mouse-x', '50%');
                         this.style.setProperty('--mouse-y', '50%');
                     """,
-                },
-            )[
-                h.svg(
-                    ".steam-icon",
-                    xmlns="http://www.w3.org/2000/svg",
-                    viewBox="0 0 24 24",
-                    fill="currentColor",
+                    },
                 )[
-                    h.path(
-                        d="M11.979 0C5.678 0 .511 4.86.022 11.037l6.432 2.658c.545-.371 1.203-.59 1.912-.59.063 0 .125.004.188.006l2.861-4.142V8.91c0-2.495 2.028-4.524 4.524-4.524 2.494 0 4.524 2.031 4.524 4.527s-2.03 4.525-4.524 4.525h-.105l-4.076 2.911c0 .052.004.105.004.159 0 1.875-1.515 3.396-3.39 3.396-1.635 0-3.016-1.173-3.331-2.727L.436 15.27C1.862 20.307 6.486 24 11.979 24c6.627 0 11.999-5.373 11.999-12S18.605 0 11.979 0zM7.54 18.21l-1.473-.61c.262.543.714.999 1.314 1.25 1.297.539 2.793-.076 3.332-1.375.263-.63.264-1.319.005-1.949s-.75-1.121-1.377-1.383c-.624-.26-1.29-.249-1.878-.03l1.523.63c.956.4 1.409 1.5 1.009 2.455-.397.957-1.497 1.41-2.454 1.012H7.54zm11.415-9.303c0-1.662-1.353-3.015-3.015-3.015-1.665 0-3.015 1.353-3.015 3.015 0 1.665 1.35 3.015 3.015 3.015 1.663 0 3.015-1.35 3.015-3.015zm-5.273-.005c0-1.252 1.013-2.266 2.265-2.266 1.249 0 2.266 1.014 2.266 2.266 0 1.251-1.017 2.265-2.266 2.265-1.253 0-2.265-1.014-2.265-2.265z"
-                    )
+                    h.svg(
+                        ".steam-icon",
+                        xmlns="http://www.w3.org/2000/svg",
+                        viewBox="0 0 24 24",
+                        fill="currentColor",
+                    )[
+                        h.path(
+                            d="M11.979 0C5.678 0 .511 4.86.022 11.037l6.432 2.658c.545-.371 1.203-.59 1.912-.59.063 0 .125.004.188.006l2.861-4.142V8.91c0-2.495 2.028-4.524 4.524-4.524 2.494 0 4.524 2.031 4.524 4.527s-2.03 4.525-4.524 4.525h-.105l-4.076 2.911c0 .052.004.105.004.159 0 1.875-1.515 3.396-3.39 3.396-1.635 0-3.016-1.173-3.331-2.727L.436 15.27C1.862 20.307 6.486 24 11.979 24c6.627 0 11.999-5.373 11.999-12S18.605 0 11.979 0zM7.54 18.21l-1.473-.61c.262.543.714.999 1.314 1.25 1.297.539 2.793-.076 3.332-1.375.263-.63.264-1.319.005-1.949s-.75-1.121-1.377-1.383c-.624-.26-1.29-.249-1.878-.03l1.523.63c.956.4 1.409 1.5 1.009 2.455-.397.957-1.497 1.41-2.454 1.012H7.54zm11.415-9.303c0-1.662-1.353-3.015-3.015-3.015-1.665 0-3.015 1.353-3.015 3.015 0 1.665 1.35 3.015 3.015 3.015 1.663 0 3.015-1.35 3.015-3.015zm-5.273-.005c0-1.252 1.013-2.266 2.265-2.266 1.249 0 2.266 1.014 2.266 2.266 0 1.251-1.017 2.265-2.266 2.265-1.253 0-2.265-1.014-2.265-2.265z"
+                        )
+                    ],
+                    h.span["Sign in through Steam"],
                 ],
-                h.span["Sign in through Steam"],
             ],
-        ],
-        container_width="500px",
+            container_width="500px",
+        )
     )
 
 
@@ -106,51 +125,54 @@ def loading_spinner(message="Loading..."):
     ]
 
 
-def friends_list_page(friends, user_name=None):
-    friend_items = [
+def refreshing_friends(poll_url: str) -> h.Element:
+    """Spinner that polls `poll_url` and is replaced by what it returns."""
+    return h.div(
+        **{
+            "hx-get": poll_url,
+            "hx-trigger": "load delay:1s",
+            "hx-swap": "outerHTML",
+        }
+    )[loading_spinner("Refreshing friends list...")]
+
+
+def friend_row(friend) -> Markup:
+    player = friend["player"]
+    return _friend_row(player["steamid"], player["personaname"], player["avatar"])
+
+
+@lru_cache(maxsize=FRIEND_ROW_CACHE_SIZE)
+def _friend_row(steamid: str, personaname: str, avatar: str) -> Markup:
+    # Selection and search live in the shared `x-data` of `friends_list_page`
+    return Markup(
         h.div(
             ".friend-item",
+            data_name=personaname.lower(),
             **{
-                ":class": f"{{'selected': selectedFriends.includes('{friend['player']['steamid']}')}}"
-            },
-            **{
-                "x-show": f"'{friend['player']['personaname'].lower()}'.includes(searchQuery.toLowerCase())"
-            },
-            **{
-                "@click": f"""
-                (() => {{
-                    const steamid = '{friend["player"]["steamid"]}';
-                    const index = selectedFriends.indexOf(steamid);
-                    const checkbox = document.getElementById('checkbox-{friend["player"]["steamid"]}');
-                    if (index === -1) {{
-                        selectedFriends.push(steamid);
-                        if (checkbox) checkbox.checked = true;
-                    }} else {{
-                        selectedFriends.splice(index, 1);
-                        if (checkbox) checkbox.checked = false;
-                    }}
-                }})()
-            """
+                ":class": f"{{'selected': selectedFriends.includes('{steamid}')}}",
+                "x-show": "matchesSearch($el.dataset.name)",
+                "@click": f"toggleFriend('{steamid}')",
             },
         )[
             h.input(
                 ".hidden-checkbox",
                 type="checkbox",
                 name="selected_friends",
-                id=f"checkbox-{friend['player']['steamid']}",
-                value=friend["player"]["steamid"],
-            ),
-            h.img(
-                ".friend-avatar",
-                src=friend["player"]["avatar"],
-                alt=friend["player"]["personaname"],
+                id=f"checkbox-{steamid}",
+                value=steamid,
             ),
-            h.div(".friend-info")[
-                h.div(".friend-name")[friend["player"]["personaname"]],
-            ],
+            h.img(".friend-avatar", src=avatar, alt=personaname),
+            h.div(".friend-info")[h.div(".friend-name")[personaname]],
         ]
+    )
+
+
+@metrics.instrument("render.friends_list_page", op="render")
+def friends_list_page(friends, user_name=None):
+    friend_items = Markup("").join(
+        friend_row(friend)
         for friend in sorted(friends, key=lambda x: x["player"]["personaname"])
-    ]
+    )
 
     content = h.div[
         h.div(
@@ -164,6 +186,20 @@ def friends_list_page(friends, user_name=None):
                     selectedGroupIndex: '',
                     loadedGroupFriends: [],
                     get selectedCount() { return this.selectedFriends.length; },
+                    matchesSearch(name) {
+                        return name.includes(this.searchQuery.toLowerCase());
+                    },
+                    toggleFriend(steamid) {
+                        const index = this.selectedFriends.indexOf(steamid);
+                        const checkbox = document.getElementById('checkbox-' + steamid);
+                        if (index === -1) {
+                            this.selectedFriends.push(steamid);
+                            if (checkbox) checkbox.checked = true;
+                        } else {
+                            this.selectedFriends.splice(index, 1);
+                            if (checkbox) checkbox.checked = false;
+                        }
+                    },
                     get hasChangesFromGroup() {
                         if (this.selectedGroupIndex === '' || this.loadedGroupFriends.length === 0) return true;
                         if (this.selectedFriends.length !== this.loadedGroupFriends.length) return true;
@@ -366,12 +402,8 @@ def friends_list_page(friends, user_name=None):
     return content
 
 
-def share_button(all_user_ids: list[str]) -> h.Element:
-    share_data = {"friend_ids": all_user_ids}
-    json_str = json.dumps(share_data)
-    encoded = base64.urlsafe_b64encode(json_str.encode()).decode()
-
-    share_url_js = f"window.location.origin + '/shared/{encoded}'"
+def share_button(share_path: str) -> h.Element:
+    share_url_js = f"window.location.origin + '{share_path}'"
 
     return h.div(".share-button-container", **{"x-data": "{copied: false}"})[
         h.button(
@@ -396,25 +428,21 @@ def share_button(all_user_ids: list[str]) -> h.Element:
 def games_page(
     friend_steam_ids: list[str], all_user_ids: list[str] | None = None
 ) -> h.Element:
-    friend_ids_param = ",".join(friend_steam_ids)
     if all_user_ids is None:
         all_user_ids = friend_steam_ids
 
-    share_data = {"friend_ids": all_user_ids}
-    json_str = json.dumps(share_data)
-    all_user_ids_encoded = base64.urlsafe_b64encode(json_str.encode()).decode()
-
-    content = h.div[
-        h.div(
+    if friend_steam_ids:
+        games_list = h.div(
             id="games-list",
-            hx_get=url_for(
-                "load_common_games",
-                friend_ids=friend_ids_param,
-                share_data=all_user_ids_encoded,
-            ),
+            hx_get=url_for("load_common_games", share_data=encode_party(all_user_ids)),
             hx_trigger="load",
             hx_swap="innerHTML",
-        )[loading_spinner("Finding common games...")],
+        )[loading_spinner("Finding common games...")]
+    else:
+        games_list = h.div(id="games-list")[h.p["No friends selected."]]
+
+    content = h.div[
+        games_list,
         h.a(
             ".back-button",
             href=url_for("index"),
@@ -426,61 +454,125 @@ def games_page(
     return content
 
 
-def common_games_list(games_with_counts, total_users, share_data_encoded=None):
-    if not games_with_counts:
-        return h.div(".no-games-message")[
-            h.p["No common games found. 😢"],
-            h.p(".no-games-subtitle")["Try selecting different friends!"],
-        ]
+def game_row(game, total_users) -> Markup:
+    return _game_row(
+        game.get("appid"),
+        game.get("name", "Unknown Game"),
+        game.get("img_icon_url"),
+        "price" in game,
+        game.get("price"),
+        game["owner_count"],
+        total_users,
+        tuple(game["owner_names"]),
+    )
+
 
-    game_items = [
+@lru_cache(maxsize=GAME_ROW_CACHE_SIZE)
+def _game_row(
+    appid: int,
+    name: str | None,
+    img_icon_url: str | None,
+    priced: bool,
+    price: str | None,
+    owner_count: int,
+    total_users: int,
+    owner_names: tuple[str, ...],
+) -> Markup:
+    percentage = int(owner_count / total_users * 100)
+    return Markup(
         h.div(".game-list")[
             (
                 h.img(
                     ".game-icon",
-                    src=f"https://media.steampowered.com/steamcommunity/public/images/apps/{game.get('appid')}/{game.get('img_icon_url')}.jpg",
-                    alt=game.get("name", "Unknown"),
+                    src=f"https://media.steampowered.com/steamcommunity/public/images/apps/{appid}/{img_icon_url}.jpg",
+                    alt=name or "Unknown",
                 )
-                if game.get("img_icon_url")
+                if img_icon_url
                 else h.div(".game-icon.game-icon--placeholder")
             ),
             h.div(".game-info")[
                 h.a(
                     ".game-name",
-                    href=f"https://store.steampowered.com/app/{game.get('appid')}/",
+                    href=f"https://store.steampowered.com/app/{appid}/",
                     target="_blank",
                     rel="noopener noreferrer",
-                )[game.get("name", "Unknown Game")],
+                )[name],
                 h.div(".game-owner-count")[
-                    f"{game['owner_count']}/{total_users} people own this"
+                    f"{owner_count}/{total_users} people own this"
                 ],
-                h.p[game["price"]],
+                (
+                    h.p[price]
+                    if priced
+                    # Filled in by the prices event stream, see `game_rows`
+                    else h.p(sse_swap=f"price-{appid}")
+                ),
                 h.div(".owner-badges", **{"x-show": "showOwners"})[
-                    (h.span(".owner-badge")[name] for name in game["owner_names"])
+                    (h.span(".owner-badge")[owner] for owner in owner_names)
                 ],
             ],
             h.div(
-                f".game-percentage.game-percentage--{'full' if game['owner_count'] == total_users else 'partial'}",
-                style=f"--percentage: {int(game['owner_count'] / total_users * 100)}",
-            )[f"{int(game['owner_count'] / total_users * 100)}%"],
+                f".game-percentage.game-percentage--{'full' if owner_count == total_users else 'partial'}",
+                style=f"--percentage: {percentage}",
+            )[f"{percentage}%"],
         ]
-        for game in games_with_counts
+    )
+
+
+@metrics.instrument("render.game_rows", op="render")
+def game_rows(games, total_users, next_page_url=None, prices_url=None) -> h.Fragment:
+    rows = Markup("").join(game_row(game, total_users) for game in games)
+    return h.fragment[
+        (
+            h.div(
+                ".games-page",
+                hx_ext="sse",
+                sse_connect=prices_url,
+                sse_close="done",
+            )[rows]
+            if prices_url
+            else rows
+        ),
+        (
+            h.div(
+                ".games-loader",
+                hx_get=next_page_url,
+                hx_trigger="revealed",
+                hx_swap="outerHTML",
+            )[loading_spinner("Loading more games...")]
+            if next_page_url
+            else None
+        ),
     ]
 
-    share_button_element = None
-    if share_data_encoded:
-        try:
-            decoded_bytes = base64.urlsafe_b64decode(share_data_encoded)
-            share_data = json.loads(decoded_bytes)
-            all_user_ids = share_data.get("friend_ids", [])
-            if all_user_ids:
-                share_button_element = share_button(all_user_ids)
-        except Exception:
-            pass
+
+@metrics.instrument("render.common_games_list", op="render")
+def common_games_list(
+    games_with_counts,
+    total_users,
+    share_path=None,
+    total_count=None,
+    next_page_url=None,
+    prices_url=None,
+    notice=None,
+):
+    if total_count is None:
+        total_count = len(games_with_counts)
+
+    if not games_with_counts:
+        return h.div[
+            notice,
+            h.div(".no-games-message")[
+                h.p["No common games found. 😢"],
+                h.p(".no-games-subtitle")["Try selecting different friends!"],
+            ],
+        ]
+
+    share_button_element = share_button(share_path) if share_path else None
 
     return h.div(**{"x-data": "{ showOwners: false }"})[
+        notice,
         h.h3(".games-header")[
-            f"Found {len(games_with_counts)} game{'' if len(games_with_counts) == 1 else 's'}!"
+            f"Found {total_count} game{'' if total_count == 1 else 's'}!"
         ],
         h.div(".games-controls")[
             h.p(".games-description")["Games ranked by how many people own them"],
@@ -496,7 +588,9 @@ def common_games_list(games_with_counts, total_users, share_data_encoded=None):
                 ],
             ],
         ],
-        h.div(".games-container")[game_items],
+        h.div(".games-container")[
+            game_rows(games_with_counts, total_users, next_page_url, prices_url)
+        ],
         (
             h.div(".button-row", style="margin-top: 1.5rem;")[share_button_element]
             if share_button_element
@@ -505,6 +599,38 @@ def common_games_list(games_with_counts, total_users, share_data_encoded=None):
     ]
 
 
+def partial_results_notice(
+    missing: list[dict], stale: list[dict], poll_url: str | None = None
+) -> h.Element:
+    """Names the members a partial result left out or used old data for.
+
+    With a `poll_url`, the whole list is reloaded from it after a few seconds.
+    """
+
+    def names(members: list[dict]) -> str:
+        return ", ".join(member["personaname"] for member in members)
+
+    return h.div(
+        ".partial-results-notice",
+        **(
+            {
+                "hx-get": poll_url,
+                "hx-trigger": "load delay:3s",
+                "hx-target": "#games-list",
+                "hx-swap": "innerHTML",
+            }
+            if poll_url
+            else {}
+        ),
+    )[
+        h.p[f"Still loading the games of {names(missing)}."] if missing else None,
+        h.p[f"Using older game lists for {names(stale)}."] if stale else None,
+        h.p(".partial-results-status")[
+            "Updating the results…" if poll_url else "Try again in a moment."
+        ],
+    ]
+
+
 def private_profile_message() -> h.Element:
     return h.div(".private-profile-container")[
         h.div(".private-profile-icon")["🔒"],
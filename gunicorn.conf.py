@@ -0,0 +1,13 @@
+"""Gunicorn settings, picked up from the working directory by `gunicorn run:app`."""
+
+
+def post_worker_init(worker) -> None:
+    """Preload recently active players before the worker takes requests."""
+    from run import warm_start
+
+    try:
+        stats = warm_start()
+    except Exception:
+        worker.log.exception("Warm start failed")
+    else:
+        worker.log.info("Warm start: %s", stats)
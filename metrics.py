@@ -0,0 +1,178 @@
+"""Process-local metrics, Server-Timing breakdowns and Sentry spans.
+
+Every worker process keeps its own registry, so `/metrics` reports on the
+worker that served it.
+"""
+
+import functools
+import inspect
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import TypeVar
+
+import sentry_sdk
+from flask import g, has_app_context
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+F = TypeVar("F", bound=Callable)
+Labels = tuple[tuple[str, str], ...]
+
+
+class Registry:
+    """Thread-safe counters and latency histograms, rendered in Prometheus format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: defaultdict[tuple[str, Labels], float] = defaultdict(float)
+        # Per series: cumulative bucket counts, then sum and count
+        self._histograms: dict[tuple[str, Labels], list[float]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        with self._lock:
+            self._counters[name, _labels(labels)] += value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            series = self._histograms.setdefault(
+                (name, _labels(labels)), [0.0] * (len(LATENCY_BUCKETS) + 2)
+            )
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get((name, _labels(labels)), 0.0)
+
+    def render(self) -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+
+        lines = []
+        for (name, labels), value in counters:
+            lines.append(f"{name}{_format(labels)} {value:g}")
+
+        for cache_name in sorted(
+            {
+                dict(labels)["cache"]
+                for (name, labels), _ in counters
+                if name == "cache_lookups_total"
+            }
+        ):
+            hits = self.counter("cache_lookups_total", cache=cache_name, result="hit")
+            misses = self.counter(
+                "cache_lookups_total", cache=cache_name, result="miss"
+            )
+            lines.append(
+                f'cache_hit_ratio{{cache="{cache_name}"}} {hits / (hits + misses):g}'
+            )
+
+        for (name, labels), series in histograms:
+            for bound, count in zip(LATENCY_BUCKETS, series):
+                bucket_labels = (*labels, ("le", f"{bound:g}"))
+                lines.append(f"{name}_bucket{_format(bucket_labels)} {count:g}")
+            lines.append(
+                f"{name}_bucket{_format((*labels, ('le', '+Inf')))} {series[-1]:g}"
+            )
+            lines.append(f"{name}_sum{_format(labels)} {series[-2]:g}")
+            lines.append(f"{name}_count{_format(labels)} {series[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = value.replace("\\", r"\\").replace('"', r"\"")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+registry = Registry()
+_timings_lock = threading.Lock()
+
+
+def request_timings() -> dict[str, list[float]] | None:
+    """This request's `{span: [total seconds, calls]}`, shared with its pool threads."""
+    if not has_app_context():
+        return None
+    if "server_timings" not in g:
+        g.server_timings = {}
+    return g.server_timings
+
+
+def share_request_timings(timings: dict[str, list[float]] | None) -> None:
+    """Record spans of the current (pool thread) app context into `timings`."""
+    if timings is not None and has_app_context():
+        g.server_timings = timings
+
+
+def cache_lookup(cache_name: str, hits: int, misses: int) -> None:
+    if hits:
+        registry.inc("cache_lookups_total", hits, cache=cache_name, result="hit")
+    if misses:
+        registry.inc("cache_lookups_total", misses, cache=cache_name, result="miss")
+
+
+@contextmanager
+def span(name: str, op: str = "function") -> Iterator[None]:
+    """Time a block as a Sentry span, a histogram series and a Server-Timing entry."""
+    started = time.perf_counter()
+    with sentry_sdk.start_span(op=op, name=name):
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - started
+            registry.observe("span_duration_seconds", duration, span=name)
+            timings = request_timings()
+            if timings is not None:
+                with _timings_lock:
+                    entry = timings.setdefault(name, [0.0, 0])
+                    entry[0] += duration
+                    entry[1] += 1
+
+
+def instrument(name: str, op: str = "function") -> Callable[[F], F]:
+    """Run every call of the decorated (sync or async) function in a `span`."""
+
+    def decorator(fn: F) -> F:
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, op):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, op):
+                return fn(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def server_timing_header(total: float) -> str:
+    """Format this request's spans, plus `total` seconds, as a Server-Timing value."""
+    entries = [f"total;dur={total * 1000:.1f}"]
+    for name, (duration, calls) in sorted((request_timings() or {}).items()):
+        entry = f"{name};dur={duration * 1000:.1f}"
+        if calls > 1:
+            entry += f';desc="{calls} calls"'
+        entries.append(entry)
+    return ", ".join(entries)
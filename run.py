@@ -1,27 +1,50 @@
-import base64
-import json
 import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+import click
 import htpy as h
 import sentry_sdk
 from dotenv import load_dotenv
-from flask import Flask, redirect, request, session, url_for
-from flask_caching import Cache
+from flask import (
+    Flask,
+    Response,
+    current_app,
+    g,
+    redirect,
+    request,
+    session,
+    stream_with_context,
+    url_for,
+)
+from markupsafe import escape
 
+import metrics
 import steam as steam_api
+from caching import cache
 from components import (
+    FRIEND_ROW_CACHE_SIZE,
     base_layout,
     common_games_list,
     error_loading_games_warning,
+    friend_row,
     friends_list_page,
+    game_rows,
     games_page,
     invalid_share_link_warning,
     load_friends_content,
     loading_spinner,
     login_page,
+    partial_results_notice,
     private_profile_message,
+    refreshing_friends,
 )
+from sharing import InvalidShareToken, decode_party, resolve_short_id, share_path
+from steam import store, warmup
+from steam.groups import GROUPS_MAX_SIZE, GROUPS_TOP_K, suggest_groups
+from steam.prefetch import cancel_prefetch, prefetch_owned_games
 
 load_dotenv()
 
@@ -37,12 +60,264 @@ app.config["CACHE_TYPE"] = "FileSystemCache"
 app.config["CACHE_DIR"] = cache_dir
 app.config["CACHE_DEFAULT_TIMEOUT"] = 900
 
-cache = Cache(app)
+cache.init_app(app)
+
+COMMON_GAMES_PAGE_SIZE = 50
+COMMON_GAMES_RESULT_TIMEOUT = 900
+FRIENDS_CACHE_TIMEOUT = 24 * 60 * 60  # Hard expiry of a stored friends list
+FRIENDS_REFRESH_AFTER = 900  # Older lists are served, then refreshed in the background
+FRIENDS_REFRESH_MAX_POLLS = (
+    15  # Polls for an explicitly refreshed list before giving up
+)
+COMMON_GAMES_MAX_POLLS = 5  # Re-polls of a partial result before giving up
+# Most recently seen players preloaded into memory when a worker boots
+WARM_START_PLAYERS = int(os.getenv("WARM_START_PLAYERS", "200"))
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_timing(response: Response) -> Response:
+    """Count the request and expose its span breakdown as Server-Timing."""
+    started = g.get("request_started")
+    if started is None:
+        return response
+
+    duration = time.perf_counter() - started
+    endpoint = request.endpoint or "unknown"
+    metrics.registry.inc(
+        "http_requests_total", endpoint=endpoint, status=response.status_code
+    )
+    metrics.registry.observe(
+        "http_request_duration_seconds", duration, endpoint=endpoint
+    )
+    response.headers["Server-Timing"] = metrics.server_timing_header(duration)
+    return response
+
+
+_friends_refresher = ThreadPoolExecutor(
+    max_workers=2, thread_name_prefix="friends-refresh"
+)
+_refreshing_friends: set[str] = set()
+_refreshing_friends_lock = threading.Lock()
 
 
-@cache.memoize(timeout=900)
 def get_steam_friends(steam_id: str) -> list[dict]:
-    return steam_api.get_steam_friends_from_api(steam_id)
+    """Stale-while-revalidate: only block on Steam when nothing is cached."""
+    friends = cached_steam_friends(steam_id)
+    if friends is None:
+        friends = steam_api.get_steam_friends_from_api(steam_id)
+        store_steam_friends(steam_id, friends)
+    return friends
+
+
+def cached_steam_friends(steam_id: str) -> list[dict] | None:
+    """The stored friends list, refreshed in the background once it's stale."""
+    stored = store.get_friends(steam_id, max_age=FRIENDS_CACHE_TIMEOUT)
+    if stored is None:
+        return None
+    friends, fetched_at = stored
+    if time.time() - fetched_at > FRIENDS_REFRESH_AFTER:
+        refresh_steam_friends_in_background(steam_id)
+    return friends
+
+
+def store_steam_friends(steam_id: str, friends: list[dict]) -> None:
+    store.put_friends(steam_id, [friend["player"]["steamid"] for friend in friends])
+
+
+def refresh_steam_friends_in_background(steam_id: str) -> None:
+    with _refreshing_friends_lock:
+        if steam_id in _refreshing_friends:
+            return
+        _refreshing_friends.add(steam_id)
+
+    flask_app = current_app._get_current_object()  # type: ignore[attr-defined]
+
+    def refresh() -> None:
+        try:
+            with flask_app.app_context():
+                friends = steam_api.get_steam_friends_from_api(steam_id)
+                store_steam_friends(steam_id, friends)
+        except steam_api.SteamProfileNotPublic:
+            store.delete_friends(steam_id)
+        except Exception:
+            logging.exception("Error refreshing friends")
+        finally:
+            with _refreshing_friends_lock:
+                _refreshing_friends.discard(steam_id)
+
+    _friends_refresher.submit(refresh)
+
+
+def friends_refresh_poll(steam_id: str) -> str | None:
+    """While an explicit refresh hasn't stored a newer list yet, poll again.
+
+    `/refresh-friends` passes the time it was requested as `refreshed_after`.
+    """
+    requested_at = request.args.get("refreshed_after", type=float)
+    if requested_at is None:
+        return None
+
+    poll = request.args.get("poll", 0, type=int)
+    stored = store.get_friends(steam_id, max_age=FRIENDS_CACHE_TIMEOUT)
+    if stored is None or stored[1] >= requested_at or poll >= FRIENDS_REFRESH_MAX_POLLS:
+        return None
+    return str(
+        refreshing_friends(
+            url_for("load_friends", refreshed_after=requested_at, poll=poll + 1)
+        )
+    )
+
+
+def render_friends_page(steam_id: str, friends: list[dict], user_details: dict) -> str:
+    store.mark_seen(steam_id)
+    prefetch_owned_games(
+        steam_id,
+        [steam_id]
+        + [
+            friend["player"]["steamid"]
+            for friend in friends
+            # Only public profiles (visibility state 3) expose their library
+            if friend["player"].get("communityvisibilitystate") == 3
+        ],
+    )
+
+    user_name = user_details["player"]["personaname"]
+    return str(friends_list_page(friends, user_name))
+
+
+def common_games_party() -> list[str]:
+    """Steam ids whose common games `/load-common-games` was asked for."""
+    steam_id = session.get("steam_id")
+
+    # A share token already contains the whole party
+    share_data = request.args.get("share_data")
+    if share_data:
+        friend_ids = decode_party(share_data)
+        # Shared link: add current user if logged in and not already in the list
+        if steam_id and steam_id not in friend_ids:
+            return [steam_id] + friend_ids
+        return friend_ids
+
+    friend_ids = request.args.get("friend_ids", "").split(",")
+
+    # Normal flow: add current user to friend selection
+    return [steam_id] + friend_ids if steam_id else friend_ids
+
+
+def render_common_games(all_user_ids: list[str], ranked_games: list[dict]) -> str:
+    """Store the ranked result for pagination and render its first page.
+
+    Results are keyed by party and library versions, so every view of the
+    same party shares one stored result instead of adding another.
+    """
+    total_users = len(all_user_ids)
+    result_id = steam_api.party_result_id(all_user_ids, total_users)
+    result = {"games": ranked_games, "total_users": total_users}
+    cache.set(
+        common_games_result_key(result_id),
+        result,
+        timeout=COMMON_GAMES_RESULT_TIMEOUT,
+    )
+
+    games, next_page_url, prices_url = common_games_page(result_id, result, 0)
+    share_data = request.args.get("share_data")
+    return str(
+        common_games_list(
+            games,
+            total_users,
+            share_path(share_data) if share_data else None,
+            total_count=len(ranked_games),
+            next_page_url=next_page_url,
+            prices_url=prices_url,
+            notice=partial_results_notice_for(all_user_ids),
+        )
+    )
+
+
+def partial_results_notice_for(all_user_ids: list[str]):
+    """Flag members missing from a partial result and re-poll for the full one."""
+    status = steam_api.party_status(all_user_ids)
+    if not status["missing"] and not status["stale"]:
+        return None
+
+    poll = request.args.get("poll", 0, type=int)
+    poll_url = (
+        url_for("load_common_games", **{**request.args.to_dict(), "poll": poll + 1})
+        if poll < COMMON_GAMES_MAX_POLLS
+        else None
+    )
+    return partial_results_notice(status["missing"], status["stale"], poll_url)
+
+
+def warm_start(limit: int = WARM_START_PLAYERS) -> dict[str, int]:
+    """Preload recently active players into this process's in-memory caches.
+
+    Friends lists, libraries and prices of the
+    players and their friends from the store; nothing is fetched from Steam.
+    The static page parts are pre-rendered too, and friend rows until their
+    cache is full, most recently seen players first. Run by the gunicorn
+    `post_worker_init` hook and on ASGI startup.
+    """
+    with app.test_request_context():
+        login_page()
+        steam_ids = store.recent_players(limit)
+
+        party_ids = dict.fromkeys(steam_ids)
+        friend_ids: set[str] = set()
+        for steam_id in steam_ids:
+            # More rows would only evict those of more recent players
+            room = FRIEND_ROW_CACHE_SIZE - len(friend_ids)
+            if room <= 0:
+                break
+            stored = store.get_friends(steam_id, max_age=FRIENDS_CACHE_TIMEOUT)
+            for friend in stored[0][:room] if stored else []:
+                friend_row(friend)
+                friend_ids.add(friend["player"]["steamid"])
+                party_ids[friend["player"]["steamid"]] = None
+
+        return {
+            "players": len(steam_ids),
+            "friend_rows": len(friend_ids),
+            **warmup.preload(list(party_ids)),
+        }
+
+
+def finish_login(steam_id: str | None):
+    if steam_id:
+        session["steam_id"] = steam_id
+        store.mark_seen(steam_id)
+        return redirect(url_for("index"))
+    else:
+        logging.error("Failed to authenticate with Steam")
+
+
+def common_games_result_key(result_id: str) -> str:
+    return f"common_games_result/{result_id}"
+
+
+def common_games_slice(result: dict, page: int) -> list[dict]:
+    start = page * COMMON_GAMES_PAGE_SIZE
+    return result["games"][start : start + COMMON_GAMES_PAGE_SIZE]
+
+
+def common_games_page(result_id: str, result: dict, page: int):
+    """Return one page of unpriced rows, the next page's URL and its prices URL.
+
+    Prices are streamed separately by `stream_common_games_prices`.
+    """
+    games = steam_api.with_apps(common_games_slice(result, page))
+    next_page_url = (
+        url_for("load_more_common_games", result_id=result_id, page=page + 1)
+        if (page + 1) * COMMON_GAMES_PAGE_SIZE < len(result["games"])
+        else None
+    )
+    prices_url = url_for("stream_common_games_prices", result_id=result_id, page=page)
+    return games, next_page_url, prices_url
 
 
 @app.route("/")
@@ -60,16 +335,17 @@ def load_friends():
     if not steam_id:
         return redirect(url_for("index"))
 
+    poll = friends_refresh_poll(steam_id)
+    if poll:
+        return poll
+
     try:
         friends = get_steam_friends(steam_id)
     except steam_api.SteamProfileNotPublic:
-        cache.delete_memoized(get_steam_friends, steam_id)
         return str(private_profile_message())
 
     user_details = steam_api.get_user_details(steam_id)
-    user_name = user_details["player"]["personaname"]
-
-    return str(friends_list_page(friends, user_name))
+    return render_friends_page(steam_id, friends, user_details)
 
 
 @app.route("/refresh-friends")
@@ -78,17 +354,16 @@ def refresh_friends():
     if not steam_id:
         return redirect(url_for("index"))
 
-    cache.delete_memoized(get_steam_friends, steam_id)
+    requested_at = time.time()
+    # Friends' libraries expire on their own; only the user's is refreshed now
+    steam_api.invalidate_players([steam_id])
+    if store.get_friends(steam_id, max_age=FRIENDS_CACHE_TIMEOUT):
+        refresh_steam_friends_in_background(steam_id)
 
-    # Return loading spinner that will trigger the actual load
+    # Without a stored list, `/load-friends` fetches one before answering;
+    # otherwise it keeps polling until the background refresh has stored one
     return str(
-        h.div(
-            **{
-                "hx-get": url_for("load_friends"),
-                "hx-trigger": "load",
-                "hx-swap": "innerHTML",
-            }
-        )[loading_spinner("Refreshing friends list...")]
+        refreshing_friends(url_for("load_friends", refreshed_after=requested_at))
     )
 
 
@@ -101,18 +376,14 @@ def login():
 
 @app.route("/authorize")
 def authorize():
-    steam_id = steam_api.validate_steam_login()
-
-    if steam_id:
-        session["steam_id"] = steam_id
-        return redirect(url_for("index"))
-    else:
-        logging.error("Failed to authenticate with Steam")
+    return finish_login(steam_api.validate_steam_login())
 
 
 @app.route("/logout")
 def logout():
-    session.pop("steam_id", None)
+    steam_id = session.pop("steam_id", None)
+    if steam_id:
+        cancel_prefetch(steam_id)
     return redirect(url_for("index"))
 
 
@@ -126,70 +397,109 @@ def select_games():
 
 @app.route("/load-common-games")
 def load_common_games():
-    friend_ids_str = request.args.get("friend_ids", "")
-    if not friend_ids_str:
+    if not request.args.get("friend_ids") and not request.args.get("share_data"):
         return str(h.p["No friends selected."])
 
-    friend_ids = friend_ids_str.split(",")
-
-    share_data_encoded = request.args.get("share_data")
-    steam_id = session.get("steam_id")
-
-    # When share_data is present, friend_ids already contains all users from the share link
-    # Add logged in user if they're viewing the shared link and logged in
-    if share_data_encoded:
-        # Shared link: add current user if logged in and not already in the list
-        if steam_id and steam_id not in friend_ids:
-            all_user_ids = [steam_id] + friend_ids
-        else:
-            all_user_ids = friend_ids
-    else:
-        # Normal flow: add current user to friend selection
-        all_user_ids = [steam_id] + friend_ids if steam_id else friend_ids
-
     try:
-        total_users = len(all_user_ids)
-        common_games = steam_api.get_common_games(all_user_ids, total_users)
-        return str(common_games_list(common_games, total_users, share_data_encoded))
+        all_user_ids = common_games_party()
+        ranked_games = steam_api.rank_common_games(all_user_ids, len(all_user_ids))
+        return render_common_games(all_user_ids, ranked_games)
     except Exception as e:
         logging.error("Error fetching common games", extra={"exception": str(e)})
         return str(error_loading_games_warning())
 
 
+@app.route("/load-common-games/<result_id>/<int:page>")
+def load_more_common_games(result_id, page):
+    result = cache.get(common_games_result_key(result_id))
+    if result is None:
+        return str(error_loading_games_warning())
+
+    games, next_page_url, prices_url = common_games_page(result_id, result, page)
+    return str(game_rows(games, result["total_users"], next_page_url, prices_url))
+
+
+@app.route("/load-common-games/<result_id>/<int:page>/prices")
+def stream_common_games_prices(result_id, page):
+    """Server-sent events carrying one `price-<appid>` event per row of the page."""
+    result = cache.get(common_games_result_key(result_id))
+    if result is None:
+        return Response("event: done\ndata:\n\n", mimetype="text/event-stream")
+
+    app_ids = [game["appid"] for game in common_games_slice(result, page)]
+
+    def events():
+        for prices in steam_api.iter_prices(app_ids):
+            for app_id, price in prices.items():
+                yield f"event: price-{app_id}\ndata: {escape(price or '')}\n\n"
+        yield "event: done\ndata:\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.route("/shared/<data>")
 def shared_games(data):
-    """Display shared games from base64-encoded JSON data."""
+    """Display the common games of the party in a share token."""
     try:
-        decoded_bytes = base64.urlsafe_b64decode(data)
-        shared_data = json.loads(decoded_bytes)
-
-        friend_ids = shared_data.get("friend_ids", [])
-        if not friend_ids:
-            logging.error("Error decoding shared link", extra={"data": data})
-            return str(base_layout(invalid_share_link_warning()))
-
-        friend_ids_param = ",".join(friend_ids)
-
-        content = h.div[
-            h.div(
-                id="games-list",
-                hx_get=url_for(
-                    "load_common_games", friend_ids=friend_ids_param, share_data=data
-                ),
-                hx_trigger="load",
-                hx_swap="innerHTML",
-            )[loading_spinner("Finding common games...")],
-        ]
-        return str(base_layout(content))
-    except Exception as _:
+        if not decode_party(data):
+            raise InvalidShareToken(data)
+    except InvalidShareToken:
         logging.error("Error decoding shared link", extra={"data": data})
         return str(base_layout(invalid_share_link_warning()))
 
+    content = h.div[
+        h.div(
+            id="games-list",
+            hx_get=url_for("load_common_games", share_data=data),
+            hx_trigger="load",
+            hx_swap="innerHTML",
+        )[loading_spinner("Finding common games...")],
+    ]
+    return str(base_layout(content))
+
+
+@app.route("/s/<link_id>")
+def shared_games_short(link_id):
+    """Display the common games of a party shared by short id."""
+    try:
+        return shared_games(resolve_short_id(link_id))
+    except InvalidShareToken:
+        logging.error("Unknown short share link", extra={"link_id": link_id})
+        return str(base_layout(invalid_share_link_warning()))
+
 
 @app.route("/status")
 def status():
     return "ok"
 
 
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.cli.command("suggest-groups")
+@click.argument("steam_id")
+@click.option("--top-k", default=GROUPS_TOP_K, help="Groups kept per size.")
+@click.option("--max-size", default=GROUPS_MAX_SIZE, help="Largest group size.")
+@click.option("--processes", type=int, help="Pool size, defaults to the CPU count.")
+def suggest_groups_command(steam_id, top_k, max_size, processes):
+    """Store the friend groups of STEAM_ID that share the most games."""
+    for members, common_games in suggest_groups(steam_id, top_k, max_size, processes):
+        click.echo(f"{common_games:6d}  {','.join(members)}")
+
+
+@app.cli.command("warm-start")
+@click.option("--limit", default=WARM_START_PLAYERS, help="Players to preload.")
+def warm_start_command(limit):
+    """Preload recently active players and report what was loaded."""
+    for name, count in warm_start(limit).items():
+        click.echo(f"{count:8d}  {name}")
+
+
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=5000)
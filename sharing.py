@@ -0,0 +1,86 @@
+"""Compact share-link tokens for a party of Steam users.
+
+A token is a version byte followed by each member's 32-bit account id (their
+SteamID64 minus `STEAM_ID64_BASE`), sorted and de-duplicated, encoded as
+unpadded URL-safe base64. The same party therefore always gets the same
+token. Tokens from before version 1 (base64 JSON) are still accepted.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import struct
+
+from flask import url_for
+
+from steam import store
+
+SHARE_TOKEN_VERSION = 1
+STEAM_ID64_BASE = 76561197960265728
+SHORT_ID_LENGTH = 11  # URL-safe base64 characters, 66 bits of the token's hash
+# Serve `/s/<short id>` links backed by the store instead of full tokens
+SHARE_SHORT_IDS = os.getenv("SHARE_SHORT_IDS", "").lower() in ("1", "true", "yes")
+
+
+class InvalidShareToken(ValueError): ...
+
+
+def encode_party(steam_ids: list[str]) -> str:
+    try:
+        account_ids = sorted(
+            {int(steam_id) - STEAM_ID64_BASE for steam_id in steam_ids}
+        )
+        payload = struct.pack(
+            f">B{len(account_ids)}I", SHARE_TOKEN_VERSION, *account_ids
+        )
+    except (ValueError, struct.error) as e:
+        raise InvalidShareToken(f"Cannot encode party {steam_ids!r}") from e
+    return base64.urlsafe_b64encode(payload).rstrip(b"=").decode()
+
+
+def decode_party(token: str) -> list[str]:
+    try:
+        payload = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except ValueError as e:
+        raise InvalidShareToken(token) from e
+
+    if payload[:1] == b"{":
+        return _decode_legacy_party(payload)
+    if not payload or payload[0] != SHARE_TOKEN_VERSION or len(payload) % 4 != 1:
+        raise InvalidShareToken(token)
+
+    account_ids = struct.unpack(f">{len(payload) // 4}I", payload[1:])
+    return [str(STEAM_ID64_BASE + account_id) for account_id in account_ids]
+
+
+def _decode_legacy_party(payload: bytes) -> list[str]:
+    try:
+        friend_ids = json.loads(payload).get("friend_ids", [])
+    except (ValueError, AttributeError) as e:
+        raise InvalidShareToken(payload) from e
+    if not isinstance(friend_ids, list):
+        raise InvalidShareToken(payload)
+    return [str(friend_id) for friend_id in friend_ids]
+
+
+def short_id(token: str) -> str:
+    digest = hashlib.sha256(token.encode()).digest()
+    return base64.urlsafe_b64encode(digest).decode()[:SHORT_ID_LENGTH]
+
+
+def share_path(token: str) -> str:
+    """The path of the share link for `token`, a short one if enabled."""
+    if not SHARE_SHORT_IDS:
+        return url_for("shared_games", data=token)
+
+    link_id = short_id(token)
+    store.put_share_link(link_id, token)
+    return url_for("shared_games_short", link_id=link_id)
+
+
+def resolve_short_id(link_id: str) -> str:
+    token = store.get_share_link(link_id)
+    if token is None:
+        raise InvalidShareToken(link_id)
+    return token
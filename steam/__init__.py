@@ -1,22 +1,186 @@
+import hashlib
+import logging
 import os
 import re
+import tempfile
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from typing import TypeVar
+from urllib.parse import urlsplit
 
 import httpx
 from dotenv import load_dotenv
-from flask import request, url_for
-from steam_web_api import Steam  # type: ignore[import-untyped]
+from flask import current_app, has_app_context, request, url_for
+
+import metrics
+from caching import cache
+from steam import offload, store
+from steam.catalog import apps
+from steam.client import get_client
+from steam.ratelimit import DailyBudget, SingleFlight, TokenBucket
+from steam.ttl_cache import MISSING, TTLCache
 
 load_dotenv()
 
 STEAM_OPENID_URL = "https://steamcommunity.com/openid/login"
 STEAM_API_URL = "http://api.steampowered.com/ISteamUser"
+STEAM_PLAYER_SERVICE_URL = "http://api.steampowered.com/IPlayerService"
+STEAM_APP_DETAILS_URL = "https://store.steampowered.com/api/appdetails"
 STEAM_API_KEY = os.getenv("STEAM_API_KEY")
-steam = Steam(STEAM_API_KEY)
+STEAM_FETCH_CONCURRENCY = 8  # Max parallel calls when fanning out over users
+STEAM_RATE_LIMIT = float(os.getenv("STEAM_RATE_LIMIT", "5"))  # Calls per second
+STEAM_RATE_LIMIT_BURST = float(os.getenv("STEAM_RATE_LIMIT_BURST", "25"))
+STEAM_RATE_LIMIT_FILE = os.getenv(
+    "STEAM_RATE_LIMIT_FILE", os.path.join(tempfile.gettempdir(), "wcwp-steam-bucket")
+)
+# Steam allows 100,000 Web API calls per key per day
+STEAM_DAILY_LIMIT = int(os.getenv("STEAM_DAILY_LIMIT", "100000"))
+STEAM_MAX_RETRIES = 3  # Retries after a 429 before giving up
+STEAM_RETRY_BACKOFF = 1.0  # Seconds, doubled on every retry
+PLAYER_SUMMARIES_BATCH_SIZE = 100  # Max steamids per GetPlayerSummaries call
+PRICE_BATCH_SIZE = 50  # Appids per multi-app appdetails call
+PRICE_CACHE_TIMEOUT = 6 * 60 * 60
+PRICE_CACHE_MAXSIZE = 50_000
+OWNED_GAMES_CACHE_TIMEOUT = 30 * 60
+PLAYER_SUMMARY_CACHE_TIMEOUT = 60 * 60
+PARTY_RESULT_CACHE_TIMEOUT = 15 * 60
+# Seconds `get_common_games` waits for libraries before ranking what it has
+COMMON_GAMES_DEADLINE = float(os.getenv("COMMON_GAMES_DEADLINE", "8"))
+# Share of a party that must own a game for it to count as common
+COMMON_GAMES_THRESHOLD = float(os.getenv("COMMON_GAMES_THRESHOLD", "0.5"))
+
+# Keyed by (appid, country). Free and unpriced apps are cached as None.
+price_cache = TTLCache(maxsize=PRICE_CACHE_MAXSIZE, ttl=PRICE_CACHE_TIMEOUT)
+
+# Shared by every worker process on the host
+rate_limiter = TokenBucket(
+    STEAM_RATE_LIMIT, STEAM_RATE_LIMIT_BURST, path=STEAM_RATE_LIMIT_FILE
+)
+daily_budget = DailyBudget(STEAM_DAILY_LIMIT, path=f"{STEAM_RATE_LIMIT_FILE}-daily")
+_in_flight: SingleFlight[httpx.Response] = SingleFlight()
+_party_results: SingleFlight[list[dict]] = SingleFlight()
+
+
+T = TypeVar("T")
 
 
 class SteamProfileNotPublic(Exception): ...
 
 
+class SteamDailyLimitReached(Exception): ...
+
+
+def _with_app_context(fn: Callable[..., T]) -> Callable[..., T]:
+    """Carry the caller's app context into pool threads so `cache` works there.
+
+    Spans recorded in the pool thread count towards the caller's Server-Timing.
+    """
+    if not has_app_context():
+        return fn
+
+    app = current_app._get_current_object()  # type: ignore[attr-defined]
+    timings = metrics.request_timings()
+
+    def wrapper(*args, **kwargs) -> T:
+        with app.app_context():
+            metrics.share_request_timings(timings)
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def steam_get(url: str, params: dict) -> httpx.Response:
+    """GET a Steam endpoint through the shared rate limiter.
+
+    Identical concurrent calls share one request, and 429s are retried with
+    backoff (honouring Retry-After).
+    """
+
+    endpoint = _endpoint(url)
+
+    def call() -> httpx.Response:
+        attempt = 0
+        while True:
+            _spend_daily_budget(url)
+            rate_limiter.acquire()
+            metrics.registry.inc("steam_calls_total", endpoint=endpoint)
+            with metrics.span(f"steam.{endpoint}", op="http.client"):
+                response = get_client().get(url, params=params)
+            delay = _retry_delay(url, response, attempt)
+            if delay is None:
+                return response
+            time.sleep(delay)
+            attempt += 1
+
+    return _in_flight.do(_coalesce_key(url, params), call)
+
+
+def _spend_daily_budget(url: str) -> None:
+    """Count a call against the daily Web API quota; store API calls are exempt."""
+    if urlsplit(url).hostname != "api.steampowered.com":
+        return
+    if not daily_budget.try_spend():
+        metrics.registry.inc("steam_daily_limit_reached_total", endpoint=_endpoint(url))
+        raise SteamDailyLimitReached(_endpoint(url))
+
+
+def _endpoint(url: str) -> str:
+    """`GetOwnedGames` for `.../IPlayerService/GetOwnedGames/v1/` and the like."""
+    parts = [part for part in urlsplit(url).path.split("/") if part]
+    if len(parts) > 1 and re.fullmatch(r"v\d+", parts[-1]):
+        return parts[-2]
+    return parts[-1] if parts else "unknown"
+
+
+def _coalesce_key(url: str, params: dict) -> tuple:
+    return (url, tuple(sorted((k, str(v)) for k, v in params.items() if k != "key")))
+
+
+def _retry_delay(url: str, response: httpx.Response, attempt: int) -> float | None:
+    """Seconds to wait before retrying `response`, or None to accept it."""
+    if response.status_code != 429 or attempt >= STEAM_MAX_RETRIES:
+        return None
+
+    metrics.registry.inc("steam_rate_limited_total", endpoint=_endpoint(url))
+    retry_after = response.headers.get("Retry-After", "")
+    delay = (
+        float(retry_after)
+        if retry_after.isdigit()
+        else STEAM_RETRY_BACKOFF * 2**attempt
+    )
+    logging.warning(
+        "Rate limited by Steam, backing off", extra={"url": url, "delay": delay}
+    )
+    return delay
+
+
+def _batches(items: list[T], size: int) -> list[list[T]]:
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def _party_digest(party: tuple[str, ...], *params) -> str:
+    """Hash `party` and `params` with the current versions of its libraries."""
+    versions = store.library_versions(list(party))
+    return hashlib.sha1(repr((party, *params, versions)).encode()).hexdigest()
+
+
+def _party_result_key(
+    party: tuple[str, ...], min_owners: int, limit: int | None = None
+) -> str:
+    return f"party_result/{_party_digest(party, min_owners, limit)}"
+
+
+def party_result_id(all_user_ids, total_users: int) -> str:
+    """An id for the ranking of `all_user_ids` that only changes with its inputs."""
+    return _party_digest(_party(all_user_ids), total_users)
+
+
+def invalidate_players(steam_ids: list[str]) -> None:
+    """Mark the stored owned games and persona summaries of the given users stale."""
+    store.mark_players_stale(steam_ids)
+
+
 def get_steam_login_url():
     params = {
         "openid.ns": "http://specs.openid.net/auth/2.0",
@@ -35,14 +199,15 @@ def get_steam_login_url():
     return f"{STEAM_OPENID_URL}?{query_string}"
 
 
-def validate_steam_login():
+def _check_authentication_params() -> dict:
     params = {
         key: value for key, value in request.args.items() if key.startswith("openid.")
     }
     params["openid.mode"] = "check_authentication"
+    return params
 
-    response = httpx.post(STEAM_OPENID_URL, data=params)
 
+def _claimed_steam_id(response: httpx.Response) -> str | None:
     if "is_valid:true" in response.text:
         claimed_id = request.args.get("openid.claimed_id", "")
         match = re.search(r"steamcommunity.com/openid/id/(\d+)", claimed_id)
@@ -52,11 +217,21 @@ def validate_steam_login():
     return None
 
 
-def get_steam_friends_from_api(steam_id: str) -> list[dict]:
-    response = httpx.get(
-        f"http://api.steampowered.com/ISteamUser/GetFriendList/v0001/?key={STEAM_API_KEY}&steamid={steam_id}&relationship=friend"
+@metrics.instrument("steam.validate_steam_login")
+def validate_steam_login():
+    metrics.registry.inc("steam_calls_total", endpoint=_endpoint(STEAM_OPENID_URL))
+    response = get_client().post(STEAM_OPENID_URL, data=_check_authentication_params())
+    return _claimed_steam_id(response)
+
+
+def _friend_list_request(steam_id: str) -> tuple[str, dict]:
+    return (
+        f"{STEAM_API_URL}/GetFriendList/v0001/",
+        {"key": STEAM_API_KEY, "steamid": steam_id, "relationship": "friend"},
     )
 
+
+def _friend_ids(response: httpx.Response) -> list[str]:
     data = response.json()
 
     if "friendslist" not in data:
@@ -66,73 +241,502 @@ def get_steam_friends_from_api(steam_id: str) -> list[dict]:
             raise SteamProfileNotPublic
         return []  # Empty friends list
 
-    friend_ids = [friend["steamid"] for friend in data["friendslist"]["friends"]]
+    return [friend["steamid"] for friend in data["friendslist"]["friends"]]
 
-    return [steam.users.get_user_details(friend_id) for friend_id in friend_ids]
+
+@metrics.instrument("steam.get_steam_friends_from_api")
+def get_steam_friends_from_api(steam_id: str) -> list[dict]:
+    response = steam_get(*_friend_list_request(steam_id))
+    return get_player_summaries(_friend_ids(response))
+
+
+def _player_summaries_request(steam_ids: list[str]) -> tuple[str, dict]:
+    return (
+        f"{STEAM_API_URL}/GetPlayerSummaries/v2/",
+        {"key": STEAM_API_KEY, "steamids": ",".join(steam_ids)},
+    )
+
+
+def _fetch_player_summaries_batch(steam_ids: list[str]) -> list[dict]:
+    response = steam_get(*_player_summaries_request(steam_ids))
+    return response.json()["response"].get("players", [])
+
+
+def _cached_player_summaries(steam_ids: list[str]) -> dict[str, dict]:
+    players = store.get_players(steam_ids, max_age=PLAYER_SUMMARY_CACHE_TIMEOUT)
+    metrics.cache_lookup("players", len(players), len(steam_ids) - len(players))
+    return players
+
+
+def _store_player_summaries(players: dict[str, dict]) -> None:
+    if players:
+        store.put_players(players)
+
+
+@metrics.instrument("steam.get_player_summaries")
+def get_player_summaries(steam_ids: list[str]) -> list[dict]:
+    """Resolve many profiles at once, in chunks of 100 fetched concurrently.
+
+    Profiles are cached per steam id. Returns one {"player": {...}} dict per
+    found profile, in input order.
+    """
+    unique_ids = list(dict.fromkeys(steam_ids))
+    players = _cached_player_summaries(unique_ids)
+
+    misses = [steam_id for steam_id in unique_ids if steam_id not in players]
+    batches = _batches(misses, PLAYER_SUMMARIES_BATCH_SIZE)
+    if batches:
+        with ThreadPoolExecutor(max_workers=len(batches)) as executor:
+            results = executor.map(
+                _with_app_context(_fetch_player_summaries_batch), batches
+            )
+            fetched = {
+                player["steamid"]: player for batch in results for player in batch
+            }
+        _store_player_summaries(fetched)
+        players.update(fetched)
+
+    return _in_input_order(steam_ids, players)
+
+
+def _in_input_order(steam_ids: list[str], players: dict[str, dict]) -> list[dict]:
+    return [
+        {"player": players[steam_id]} for steam_id in steam_ids if steam_id in players
+    ]
 
 
 def get_user_details(steam_id: str) -> dict:
-    return steam.users.get_user_details(steam_id)
+    summaries = get_player_summaries([steam_id])
+    return summaries[0] if summaries else {"player": None}
+
 
+def is_owned_games_cached(user_id: str) -> bool:
+    cached = store.has_library(user_id, max_age=OWNED_GAMES_CACHE_TIMEOUT)
+    metrics.cache_lookup("libraries", int(cached), int(not cached))
+    return cached
 
+
+def _owned_games_request(
+    user_id: str, include_appinfo: bool = True, app_ids: list[int] | None = None
+) -> tuple[str, dict]:
+    params = {
+        "key": STEAM_API_KEY,
+        "steamid": user_id,
+        "include_appinfo": include_appinfo,
+        "include_played_free_games": True,
+    }
+    for index, app_id in enumerate(app_ids or []):
+        params[f"appids_filter[{index}]"] = app_id
+    return f"{STEAM_PLAYER_SERVICE_URL}/GetOwnedGames/v1/", params
+
+
+def _cached_owned_games(user_id: str) -> dict | None:
+    return store.get_library(user_id, max_age=OWNED_GAMES_CACHE_TIMEOUT)
+
+
+def _store_owned_games(user_id: str, owned_games: dict) -> None:
+    store.put_library(user_id, owned_games)
+
+
+def _fetch_owned_games(user_id: str) -> dict:
+    """Fetch a library and store it as a delta against the stored one.
+
+    A library that is already stored is refreshed without app info, which is
+    most of the payload. Names and icons are then fetched only for appids the
+    store has never seen.
+    """
+    refresh = store.library_appids(user_id) is not None
+    owned_games = steam_get(
+        *_owned_games_request(user_id, include_appinfo=not refresh)
+    ).json()["response"]
+
+    if refresh:
+        unknown = store.unknown_apps(
+            [game["appid"] for game in owned_games.get("games", [])]
+        )
+        if unknown:
+            response = steam_get(
+                *_owned_games_request(user_id, app_ids=sorted(unknown))
+            )
+            _store_apps(response.json()["response"].get("games", []))
+
+    _store_owned_games(user_id, owned_games)
+    return owned_games
+
+
+def _store_apps(games: list[dict]) -> None:
+    store.put_apps(games)
+    apps.put(games)
+
+
+@metrics.instrument("steam.get_owned_games")
 def get_owned_games(user_id: str) -> dict:
-    return steam.users.get_owned_games(user_id)
+    cached = _cached_owned_games(user_id)
+    if cached is not None:
+        return cached
+    return _fetch_owned_games(user_id)
 
 
-def get_price(app_id: str) -> str | None:
-    try:
-        data = steam.apps.get_app_details(app_id, filters="price_overview")[str(app_id)]
-        return data["data"]["price_overview"]["final_formatted"]
-    except Exception:
-        return None
+@metrics.instrument("steam.ensure_libraries")
+def ensure_libraries(user_ids: list[str], deadline: float | None = None) -> set[str]:
+    """Make sure every user's library is fresh in the store.
 
+    Missing or expired libraries are fetched in parallel, capped at
+    STEAM_FETCH_CONCURRENCY. Returns the users whose library is available.
+    When a fetch fails, or is still running after `deadline` seconds, an
+    expired library is used if one is stored; otherwise the user is left
+    out. Fetches still running carry on in the background.
+    """
 
-def get_common_games(all_user_ids, total_users):
-    user_details = {}
-    for user_id in all_user_ids:
+    def ensure(user_id: str) -> bool:
         try:
-            details = get_user_details(user_id)
-            user_details[user_id] = details["player"]["personaname"]
+            if not is_owned_games_cached(user_id):
+                _fetch_owned_games(user_id)
+            return True
         except Exception:
-            user_details[user_id] = "Unknown User"
-
-    user_games = {}
-    all_games = {}
-    game_owners = {}
-
-    for user_id in all_user_ids:
-        games = get_owned_games(user_id)
-        if games and "games" in games:
-            user_games[user_id] = set()
-            for game in games["games"]:
-                appid = game["appid"]
-                user_games[user_id].add(appid)
-                if appid not in all_games:
-                    all_games[appid] = game
-                if appid not in game_owners:
-                    game_owners[appid] = []
-                game_owners[appid].append(user_id)
+            return False
+
+    unique_ids = list(dict.fromkeys(user_ids))
+    if not unique_ids:
+        return set()
+
+    max_workers = min(STEAM_FETCH_CONCURRENCY, len(unique_ids))
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {
+        executor.submit(_with_app_context(ensure), user_id): user_id
+        for user_id in unique_ids
+    }
+    done, _ = wait(futures, timeout=deadline)
+    executor.shutdown(wait=False)
+
+    available = {futures[future] for future in done if future.result()}
+    unavailable = [user_id for user_id in unique_ids if user_id not in available]
+    return available | store.library_fetched_at(unavailable).keys()
+
+
+def _missing_and_stale(all_user_ids) -> tuple[list[str], list[str]]:
+    unique_ids = list(dict.fromkeys(all_user_ids))
+    fetched_at = store.library_fetched_at(unique_ids)
+    cutoff = time.time() - OWNED_GAMES_CACHE_TIMEOUT
+    missing = [user_id for user_id in unique_ids if user_id not in fetched_at]
+    stale = [
+        user_id
+        for user_id in unique_ids
+        if user_id in fetched_at and fetched_at[user_id] < cutoff
+    ]
+    return missing, stale
+
+
+def party_is_fresh(all_user_ids) -> bool:
+    """Whether every member's library is stored and fresh."""
+    missing, stale = _missing_and_stale(all_user_ids)
+    return not missing and not stale
+
+
+def party_status(all_user_ids) -> dict[str, list[dict]]:
+    """Members whose library is `missing` from the store, or `stale`.
+
+    Each member is a {"steamid", "personaname"} dict.
+    """
+    missing, stale = _missing_and_stale(all_user_ids)
+    players = _cached_player_summaries(missing + stale)
+
+    def members(user_ids: list[str]) -> list[dict]:
+        return [
+            {
+                "steamid": user_id,
+                "personaname": players.get(user_id, {}).get(
+                    "personaname", "Unknown User"
+                ),
+            }
+            for user_id in user_ids
+        ]
+
+    return {"missing": members(missing), "stale": members(stale)}
+
+
+def _prices_request(app_ids: list[int], country: str) -> tuple[str, dict]:
+    return (
+        STEAM_APP_DETAILS_URL,
+        {
+            "appids": ",".join(str(app_id) for app_id in app_ids),
+            "cc": country,
+            "filters": "price_overview",
+        },
+    )
+
+
+def _parse_prices(
+    response: httpx.Response, app_ids: list[int]
+) -> dict[int, str | None]:
+    data = response.json() or {}
+
+    prices: dict[int, str | None] = {}
+    for app_id in app_ids:
+        details = data.get(str(app_id)) or {}
+        # Free apps come back as `"data": []` rather than a dict
+        price_overview = (details.get("data") or {}).get("price_overview") or {}
+        prices[app_id] = price_overview.get("final_formatted")
+    return prices
+
+
+def _split_cached_prices(
+    app_ids: list[int], country: str
+) -> tuple[dict[int, str | None], list[int]]:
+    """Return the cached prices and the appids that still need fetching.
+
+    `price_cache` is checked first, then the persistent store.
+    """
+    cached_prices: dict[int, str | None] = {}
+    misses = []
+    for app_id in dict.fromkeys(int(app_id) for app_id in app_ids):
+        cached = price_cache.get((app_id, country))
+        if cached is MISSING:
+            misses.append(app_id)
         else:
-            user_games[user_id] = set()
+            cached_prices[app_id] = cached
+
+    stored = store.get_prices(misses, country, max_age=PRICE_CACHE_TIMEOUT)
+    metrics.cache_lookup("prices", len(cached_prices), len(misses))
+    metrics.cache_lookup("stored_prices", len(stored), len(misses) - len(stored))
+    for app_id, price in stored.items():
+        price_cache.set((app_id, country), price)
+    cached_prices.update(stored)
+    return cached_prices, [app_id for app_id in misses if app_id not in stored]
 
-    game_owner_counts = {}
-    for appid in all_games.keys():
-        count = sum(
-            1 for user_game_set in user_games.values() if appid in user_game_set
+
+def _store_prices(prices: dict[int, str | None], country: str) -> None:
+    for app_id, price in prices.items():
+        price_cache.set((app_id, country), price)
+    store.put_prices(prices, country)
+
+
+def _fetch_prices_batch(app_ids: list[int], country: str) -> dict[int, str | None]:
+    return _parse_prices(steam_get(*_prices_request(app_ids, country)), app_ids)
+
+
+def iter_prices(
+    app_ids: list[int], country: str = "US"
+) -> Iterator[dict[int, str | None]]:
+    """Yield formatted prices in chunks as they become available.
+
+    Hits from `price_cache` come first; misses are fetched in multi-appid
+    batches, concurrently, and each batch is yielded as soon as it completes.
+    """
+    cached_prices, misses = _split_cached_prices(app_ids, country)
+    if cached_prices:
+        yield cached_prices
+
+    batches = _batches(misses, PRICE_BATCH_SIZE)
+
+    def fetch(batch: list[int]) -> dict[int, str | None]:
+        try:
+            fetched = _fetch_prices_batch(batch, country)
+        except Exception:
+            # Leave the cache untouched so the next request retries
+            return dict.fromkeys(batch)
+        _store_prices(fetched, country)
+        return fetched
+
+    if batches:
+        max_workers = min(STEAM_FETCH_CONCURRENCY, len(batches))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(_with_app_context(fetch), batch) for batch in batches
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+
+
+@metrics.instrument("steam.get_prices")
+def get_prices(app_ids: list[int], country: str = "US") -> dict[int, str | None]:
+    prices: dict[int, str | None] = {}
+    for chunk in iter_prices(app_ids, country):
+        prices.update(chunk)
+    return prices
+
+
+def get_price(app_id: str, country: str = "US") -> str | None:
+    return get_prices([int(app_id)], country)[int(app_id)]
+
+
+def _min_owners(total_users: int, threshold: float = COMMON_GAMES_THRESHOLD) -> int:
+    return max(2, int(total_users * threshold))
+
+
+@metrics.instrument("steam.rank_common_games")
+def rank_common_games(
+    all_user_ids,
+    total_users,
+    deadline=COMMON_GAMES_DEADLINE,
+    limit: int | None = None,
+    threshold: float = COMMON_GAMES_THRESHOLD,
+):
+    """Like `get_common_games`, but leaves `price` unresolved.
+
+    Results are cached per party (sorted, de-duplicated ids plus threshold
+    and limit) and go stale as soon as any member's library is refetched.
+    A cached result is only served while every library is fresh; otherwise
+    the libraries are refreshed and the party ranked again. Identical
+    concurrent calls share one computation. Only complete results are
+    cached; see `party_status` for what a partial one is missing.
+    """
+    min_owners = _min_owners(total_users, threshold)
+    if not has_app_context():
+        return _rank_common_games(all_user_ids, min_owners, deadline, limit)[0]
+
+    party = _party(all_user_ids)
+
+    def compute() -> list[dict]:
+        cached = _cached_party_result(party, min_owners, limit)
+        metrics.cache_lookup(
+            "party_results", int(cached is not None), int(cached is None)
         )
-        game_owner_counts[appid] = count
+        if cached is not None:
+            return cached
+
+        ranked, complete = _rank_common_games(all_user_ids, min_owners, deadline, limit)
+        if complete:
+            _store_party_result(party, min_owners, ranked, limit)
+        return ranked
+
+    return _party_results.do((party, min_owners, limit), compute)
 
-    min_owners = max(2, int(total_users * 0.5))
+
+def _party(all_user_ids) -> tuple[str, ...]:
+    return tuple(sorted(set(all_user_ids)))
+
+
+def _cached_party_result(
+    party: tuple[str, ...], min_owners: int, limit: int | None = None
+) -> list[dict] | None:
+    """The cached ranking of `party`, if there is one and its libraries are fresh."""
+    cached = cache.get(_party_result_key(party, min_owners, limit))
+    if cached is None or not party_is_fresh(party):
+        return None
+    return cached
+
+
+def _store_party_result(
+    party: tuple[str, ...],
+    min_owners: int,
+    ranked: list[dict],
+    limit: int | None = None,
+) -> None:
+    # The key is built again here, since the run may have refetched libraries
+    cache.set(
+        _party_result_key(party, min_owners, limit),
+        ranked,
+        timeout=PARTY_RESULT_CACHE_TIMEOUT,
+    )
+
+
+def _rank_common_games(
+    all_user_ids,
+    min_owners: int,
+    deadline: float | None = None,
+    limit: int | None = None,
+) -> tuple[list[dict], bool]:
+    """Rank common games, also reporting whether every library was fresh."""
+    started = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=1)
+    summaries_future = executor.submit(
+        _with_app_context(get_player_summaries), all_user_ids
+    )
+    executor.shutdown(wait=False)
+
+    available = ensure_libraries(all_user_ids, deadline)
+    remaining = None if deadline is None else deadline - (time.monotonic() - started)
+    try:
+        summaries = summaries_future.result(
+            timeout=None if remaining is None else max(remaining, 0)
+        )
+    except Exception:
+        summaries = []
+
+    ranked = offload.run_sized(
+        store.owned_games_count(list(available)),
+        rank_libraries,
+        all_user_ids,
+        min_owners,
+        available,
+        summaries,
+        limit,
+    )
+    return ranked, party_is_fresh(all_user_ids)
+
+
+@metrics.instrument("steam.rank_libraries")
+def rank_libraries(
+    all_user_ids,
+    min_owners: int,
+    available: set[str],
+    summaries: list[dict],
+    limit: int | None = None,
+) -> list[dict]:
+    """Rank the games shared by the `available` libraries in the store.
+
+    The overlap and the ranking (owner count, then name) are a single query,
+    see `store.common_games`, so a `limit` keeps the top of the full ranking.
+    Rows only carry the appid; names and icons are attached per page by
+    `with_apps`. Large parties run this in the `offload` pool, so it must
+    stay picklable.
+    """
+    personanames = {
+        summary["player"]["steamid"]: summary["player"]["personaname"]
+        for summary in summaries
+    }
+    user_details = {
+        user_id: personanames.get(user_id, "Unknown User") for user_id in all_user_ids
+    }
+
+    party = [user_id for user_id in user_details if user_id in available]
+    party_order = {user_id: index for index, user_id in enumerate(party)}
 
     common_games = []
-    for appid, count in game_owner_counts.items():
-        if count >= min_owners:
-            game_info = all_games[appid].copy()
-            game_info["owner_count"] = count
-            game_info["owner_names"] = [user_details[uid] for uid in game_owners[appid]]
-            game_info["price"] = get_price(appid)
-            common_games.append(game_info)
-
-    return sorted(
-        common_games, key=lambda x: (-x["owner_count"], x.get("name", "").lower())
+    for app_id, owners in store.common_games(party, min_owners, limit):
+        owners.sort(key=party_order.__getitem__)
+        common_games.append(
+            {
+                "appid": app_id,
+                "owner_count": len(owners),
+                "owner_names": [user_details[uid] for uid in owners],
+            }
+        )
+    return common_games
+
+
+@metrics.instrument("steam.with_apps")
+def with_apps(games: list[dict]) -> list[dict]:
+    """Attach `name` and `img_icon_url` from the app catalog."""
+    catalog = apps.get_many(game["appid"] for game in games)
+    games_with_apps = []
+    for game in games:
+        app = catalog.get(game["appid"])
+        if app is None:
+            games_with_apps.append(game)
+        else:
+            games_with_apps.append(
+                {**game, "name": app.name, "img_icon_url": app.img_icon_url}
+            )
+    return games_with_apps
+
+
+def with_prices(games: list[dict]) -> list[dict]:
+    prices = get_prices([game["appid"] for game in games])
+    return [{**game, "price": prices[game["appid"]]} for game in games]
+
+
+def get_common_games(
+    all_user_ids,
+    total_users,
+    deadline=COMMON_GAMES_DEADLINE,
+    limit: int | None = None,
+    threshold: float = COMMON_GAMES_THRESHOLD,
+):
+    """Ranked common games with prices; only the top `limit` are priced."""
+    return with_prices(
+        with_apps(
+            rank_common_games(all_user_ids, total_users, deadline, limit, threshold)
+        )
     )
@@ -0,0 +1,246 @@
+"""Async twins of the Steam-bound functions in `steam`, used by `asgi.py`.
+
+They share request building, parsing and caching with the sync versions and
+only differ in awaiting the pooled `httpx.AsyncClient`.
+"""
+
+import asyncio
+
+import httpx
+from flask import has_app_context
+
+import metrics
+from steam import (
+    COMMON_GAMES_DEADLINE,
+    COMMON_GAMES_THRESHOLD,
+    PLAYER_SUMMARIES_BATCH_SIZE,
+    STEAM_FETCH_CONCURRENCY,
+    STEAM_OPENID_URL,
+    _batches,
+    _cached_owned_games,
+    _cached_party_result,
+    _cached_player_summaries,
+    _check_authentication_params,
+    _claimed_steam_id,
+    _coalesce_key,
+    _endpoint,
+    _friend_ids,
+    _friend_list_request,
+    _in_input_order,
+    _min_owners,
+    _owned_games_request,
+    _party,
+    _player_summaries_request,
+    _retry_delay,
+    _spend_daily_budget,
+    _store_apps,
+    _store_owned_games,
+    _store_party_result,
+    _store_player_summaries,
+    is_owned_games_cached,
+    offload,
+    party_is_fresh,
+    rank_libraries,
+    rate_limiter,
+    store,
+)
+from steam.client import get_async_client
+from steam.ratelimit import AsyncSingleFlight
+
+_in_flight: AsyncSingleFlight[httpx.Response] = AsyncSingleFlight()
+_party_results: AsyncSingleFlight[list[dict]] = AsyncSingleFlight()
+_background: set[asyncio.Task] = set()
+
+
+async def steam_get(url: str, params: dict) -> httpx.Response:
+    endpoint = _endpoint(url)
+
+    async def call() -> httpx.Response:
+        attempt = 0
+        while True:
+            await asyncio.to_thread(_spend_daily_budget, url)
+            await rate_limiter.acquire_async()
+            metrics.registry.inc("steam_calls_total", endpoint=endpoint)
+            with metrics.span(f"steam.{endpoint}", op="http.client"):
+                response = await get_async_client().get(url, params=params)
+            delay = _retry_delay(url, response, attempt)
+            if delay is None:
+                return response
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    return await _in_flight.do(_coalesce_key(url, params), call)
+
+
+@metrics.instrument("steam.aio.validate_steam_login")
+async def validate_steam_login():
+    metrics.registry.inc("steam_calls_total", endpoint=_endpoint(STEAM_OPENID_URL))
+    response = await get_async_client().post(
+        STEAM_OPENID_URL, data=_check_authentication_params()
+    )
+    return _claimed_steam_id(response)
+
+
+@metrics.instrument("steam.aio.get_steam_friends_from_api")
+async def get_steam_friends_from_api(steam_id: str) -> list[dict]:
+    response = await steam_get(*_friend_list_request(steam_id))
+    return await get_player_summaries(_friend_ids(response))
+
+
+async def _fetch_player_summaries_batch(steam_ids: list[str]) -> list[dict]:
+    response = await steam_get(*_player_summaries_request(steam_ids))
+    return response.json()["response"].get("players", [])
+
+
+@metrics.instrument("steam.aio.get_player_summaries")
+async def get_player_summaries(steam_ids: list[str]) -> list[dict]:
+    unique_ids = list(dict.fromkeys(steam_ids))
+    players = await asyncio.to_thread(_cached_player_summaries, unique_ids)
+
+    misses = [steam_id for steam_id in unique_ids if steam_id not in players]
+    batches = _batches(misses, PLAYER_SUMMARIES_BATCH_SIZE)
+    if batches:
+        results = await asyncio.gather(
+            *(_fetch_player_summaries_batch(batch) for batch in batches)
+        )
+        fetched = {player["steamid"]: player for batch in results for player in batch}
+        await asyncio.to_thread(_store_player_summaries, fetched)
+        players.update(fetched)
+
+    return _in_input_order(steam_ids, players)
+
+
+async def get_user_details(steam_id: str) -> dict:
+    summaries = await get_player_summaries([steam_id])
+    return summaries[0] if summaries else {"player": None}
+
+
+async def _fetch_owned_games(user_id: str) -> dict:
+    refresh = await asyncio.to_thread(store.library_appids, user_id) is not None
+    response = await steam_get(
+        *_owned_games_request(user_id, include_appinfo=not refresh)
+    )
+    owned_games = response.json()["response"]
+
+    if refresh:
+        unknown = await asyncio.to_thread(
+            store.unknown_apps, [game["appid"] for game in owned_games.get("games", [])]
+        )
+        if unknown:
+            response = await steam_get(
+                *_owned_games_request(user_id, app_ids=sorted(unknown))
+            )
+            await asyncio.to_thread(
+                _store_apps, response.json()["response"].get("games", [])
+            )
+
+    await asyncio.to_thread(_store_owned_games, user_id, owned_games)
+    return owned_games
+
+
+@metrics.instrument("steam.aio.get_owned_games")
+async def get_owned_games(user_id: str) -> dict:
+    cached = await asyncio.to_thread(_cached_owned_games, user_id)
+    if cached is not None:
+        return cached
+    return await _fetch_owned_games(user_id)
+
+
+@metrics.instrument("steam.aio.ensure_libraries")
+async def ensure_libraries(
+    user_ids: list[str], deadline: float | None = None
+) -> set[str]:
+    semaphore = asyncio.Semaphore(STEAM_FETCH_CONCURRENCY)
+
+    async def ensure(user_id: str) -> bool:
+        async with semaphore:
+            try:
+                if not await asyncio.to_thread(is_owned_games_cached, user_id):
+                    await _fetch_owned_games(user_id)
+                return True
+            except Exception:
+                return False
+
+    unique_ids = list(dict.fromkeys(user_ids))
+    if not unique_ids:
+        return set()
+
+    tasks = [asyncio.ensure_future(ensure(user_id)) for user_id in unique_ids]
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    # Late fetches carry on and land in the store for the next poll
+    for task in pending:
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+    available = {
+        user_id
+        for user_id, task in zip(unique_ids, tasks)
+        if task in done and task.result()
+    }
+    unavailable = [user_id for user_id in unique_ids if user_id not in available]
+    stored = await asyncio.to_thread(store.library_fetched_at, unavailable)
+    return available | stored.keys()
+
+
+async def _rank_common_games(
+    all_user_ids,
+    min_owners: int,
+    deadline: float | None = None,
+    limit: int | None = None,
+) -> tuple[list[dict], bool]:
+    summaries, available = await asyncio.gather(
+        asyncio.wait_for(
+            asyncio.shield(get_player_summaries(all_user_ids)), timeout=deadline
+        ),
+        ensure_libraries(all_user_ids, deadline),
+        return_exceptions=True,
+    )
+    if isinstance(available, BaseException):
+        raise available
+    if isinstance(summaries, BaseException):
+        summaries = []
+
+    ranked = await offload.run_sized_async(
+        await asyncio.to_thread(store.owned_games_count, list(available)),
+        rank_libraries,
+        all_user_ids,
+        min_owners,
+        available,
+        summaries,
+        limit,
+    )
+    return ranked, await asyncio.to_thread(party_is_fresh, all_user_ids)
+
+
+@metrics.instrument("steam.aio.rank_common_games")
+async def rank_common_games(
+    all_user_ids,
+    total_users,
+    deadline=COMMON_GAMES_DEADLINE,
+    limit: int | None = None,
+    threshold: float = COMMON_GAMES_THRESHOLD,
+):
+    min_owners = _min_owners(total_users, threshold)
+    if not has_app_context():
+        return (await _rank_common_games(all_user_ids, min_owners, deadline, limit))[0]
+
+    party = _party(all_user_ids)
+
+    async def compute() -> list[dict]:
+        cached = await asyncio.to_thread(_cached_party_result, party, min_owners, limit)
+        metrics.cache_lookup(
+            "party_results", int(cached is not None), int(cached is None)
+        )
+        if cached is not None:
+            return cached
+
+        ranked, complete = await _rank_common_games(
+            all_user_ids, min_owners, deadline, limit
+        )
+        if complete:
+            await asyncio.to_thread(
+                _store_party_result, party, min_owners, ranked, limit
+            )
+        return ranked
+
+    return await _party_results.do((party, min_owners, limit), compute)
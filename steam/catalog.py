@@ -0,0 +1,77 @@
+import threading
+from collections.abc import Iterable
+
+from steam import store
+
+
+class App:
+    """Name and icon of one Steam app, shared by every library that owns it.
+
+    The icon is kept as the raw bytes of its hex hash, 20 bytes instead of a
+    40 character string. Anything that isn't hex is kept as is.
+    """
+
+    __slots__ = ("appid", "name", "icon_hash")
+
+    def __init__(self, appid: int, name: str | None, img_icon_url: str | None):
+        self.appid = appid
+        self.name = name
+        self.icon_hash = _icon_hash(img_icon_url)
+
+    @property
+    def img_icon_url(self) -> str | None:
+        if isinstance(self.icon_hash, bytes):
+            return self.icon_hash.hex()
+        return self.icon_hash
+
+
+def _icon_hash(img_icon_url: str | None) -> bytes | str | None:
+    if not img_icon_url:
+        return None
+    try:
+        return bytes.fromhex(img_icon_url)
+    except ValueError:
+        return img_icon_url
+
+
+class AppCatalog:
+    """Process-wide, thread-safe catalog of `App` records keyed by appid.
+
+    Misses are loaded from the store, so libraries and ranked results only
+    need to carry appids.
+    """
+
+    def __init__(self):
+        self._apps: dict[int, App] = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, app_ids: Iterable[int]) -> dict[int, App]:
+        app_ids = list(dict.fromkeys(app_ids))
+        misses = [app_id for app_id in app_ids if app_id not in self._apps]
+        if misses:
+            self._add(store.get_apps(misses))
+        return {
+            app_id: self._apps[app_id] for app_id in app_ids if app_id in self._apps
+        }
+
+    def put(self, games: Iterable[dict]) -> None:
+        self._add(
+            (game["appid"], game.get("name"), game.get("img_icon_url"))
+            for game in games
+            if "name" in game
+        )
+
+    def _add(self, rows: Iterable[tuple[int, str | None, str | None]]) -> None:
+        with self._lock:
+            for appid, name, img_icon_url in rows:
+                self._apps[appid] = App(appid, name, img_icon_url)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._apps.clear()
+
+    def __len__(self) -> int:
+        return len(self._apps)
+
+
+apps = AppCatalog()
@@ -0,0 +1,75 @@
+import atexit
+import importlib.util
+import os
+import threading
+
+import httpx
+
+STEAM_HTTP_TIMEOUT = float(os.getenv("STEAM_HTTP_TIMEOUT", "10"))  # Seconds
+STEAM_HTTP_CONNECT_TIMEOUT = float(os.getenv("STEAM_HTTP_CONNECT_TIMEOUT", "5"))
+STEAM_HTTP_MAX_CONNECTIONS = int(os.getenv("STEAM_HTTP_MAX_CONNECTIONS", "32"))
+STEAM_HTTP_MAX_KEEPALIVE = int(os.getenv("STEAM_HTTP_MAX_KEEPALIVE", "16"))
+STEAM_HTTP_KEEPALIVE_EXPIRY = 60.0  # Seconds an idle connection is kept open
+
+# HTTP/2 needs the optional `h2` package (`httpx[http2]`)
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_client: httpx.Client | None = None
+_client_pid: int | None = None
+_async_client: httpx.AsyncClient | None = None
+_lock = threading.Lock()
+
+
+def _client_options() -> dict:
+    return {
+        "http2": HTTP2_AVAILABLE,
+        "timeout": httpx.Timeout(
+            STEAM_HTTP_TIMEOUT, connect=STEAM_HTTP_CONNECT_TIMEOUT
+        ),
+        "limits": httpx.Limits(
+            max_connections=STEAM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=STEAM_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=STEAM_HTTP_KEEPALIVE_EXPIRY,
+        ),
+    }
+
+
+def get_client() -> httpx.Client:
+    """Return this process's pooled client, creating it on first use.
+
+    The client is created lazily and per pid so that connections opened in a
+    gunicorn master are never shared with forked workers.
+    """
+    global _client, _client_pid
+    if _client is not None and _client_pid == os.getpid():
+        return _client
+
+    with _lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = httpx.Client(**_client_options())
+            _client_pid = os.getpid()
+        return _client
+
+
+@atexit.register
+def close_client() -> None:
+    global _client
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Pooled client for the ASGI event loop, see `asgi.py`."""
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(**_client_options())
+    return _async_client
+
+
+async def aclose_async_client() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+    _async_client = None
@@ -0,0 +1,116 @@
+"""Offline search for the friend groups that share the most games.
+
+Run per user with `flask --app run suggest-groups <steamid>`; the results end
+up in the store's `party_suggestions` table. Libraries are compared as int
+bitsets (see `overlap.build_bitsets`) in a multiprocessing pool.
+"""
+
+import heapq
+import os
+from multiprocessing import Pool
+
+from steam import ensure_libraries, get_steam_friends_from_api, store
+from steam.overlap import build_bitsets
+
+GROUPS_TOP_K = 10  # Groups kept per size, which is also the search's beam width
+GROUPS_MAX_SIZE = 4  # Including the user themselves
+GROUPS_CHUNK_SIZE = 64  # Candidates per pool task
+
+_bitsets: dict[str, int] = {}
+
+
+def _init_worker(bitsets: dict[str, int]) -> None:
+    global _bitsets
+    _bitsets = bitsets
+
+
+def _score_candidates(group_bits: int, candidates: list[str]) -> list[tuple[int, str]]:
+    """Games the group would still share with each candidate added."""
+    return [
+        ((group_bits & _bitsets[candidate]).bit_count(), candidate)
+        for candidate in candidates
+    ]
+
+
+def top_groups(
+    owner: str,
+    bitsets: dict[str, int],
+    top_k: int = GROUPS_TOP_K,
+    max_size: int = GROUPS_MAX_SIZE,
+    processes: int | None = None,
+) -> list[tuple[list[str], int]]:
+    """Beam search for the groups with `owner` that share the most games.
+
+    Size 2 is exact: `owner` paired with every other user. Each larger size
+    extends the best `top_k` groups of the size before by one member.
+    Returns `(members, common games)` pairs, `owner` first.
+    """
+    friends = [user_id for user_id in bitsets if user_id != owner]
+    beam: list[tuple[tuple[str, ...], int]] = [((owner,), bitsets[owner])]
+    results: list[tuple[list[str], int]] = []
+
+    with Pool(processes, initializer=_init_worker, initargs=(bitsets,)) as pool:
+        for _ in range(2, max_size + 1):
+            tasks = []
+            for members, group_bits in beam:
+                candidates = [friend for friend in friends if friend not in members]
+                for start in range(0, len(candidates), GROUPS_CHUNK_SIZE):
+                    chunk = candidates[start : start + GROUPS_CHUNK_SIZE]
+                    tasks.append((members, group_bits, chunk))
+
+            scored = pool.starmap(
+                _score_candidates,
+                [(group_bits, chunk) for _, group_bits, chunk in tasks],
+            )
+
+            best: dict[frozenset[str], tuple[int, tuple[str, ...], int]] = {}
+            for (members, group_bits, _), scores in zip(tasks, scored):
+                for common_games, candidate in scores:
+                    group = (*members, candidate)
+                    best.setdefault(frozenset(group), (common_games, group, group_bits))
+
+            top = heapq.nlargest(top_k, best.values(), key=lambda entry: entry[0])
+            if not top:
+                break
+            results.extend(
+                (list(group), common_games) for common_games, group, _ in top
+            )
+            beam = [
+                (group, group_bits & bitsets[group[-1]]) for _, group, group_bits in top
+            ]
+    return results
+
+
+def suggest_groups(
+    steam_id: str,
+    top_k: int = GROUPS_TOP_K,
+    max_size: int = GROUPS_MAX_SIZE,
+    processes: int | None = None,
+) -> list[tuple[list[str], int]]:
+    """Compute and store the best groups of `steam_id` and their public friends.
+
+    Libraries missing from the store are fetched first; the search itself
+    only reads stored libraries.
+    """
+    friends = get_steam_friends_from_api(steam_id)
+    user_ids = [steam_id] + [
+        friend["player"]["steamid"]
+        for friend in friends
+        # Only public profiles (visibility state 3) expose their library
+        if friend["player"].get("communityvisibilitystate") == 3
+    ]
+    ensure_libraries(user_ids)
+
+    libraries = store.library_appids_many(user_ids)
+    if steam_id not in libraries:
+        return []
+
+    groups = top_groups(
+        steam_id,
+        build_bitsets(libraries),
+        top_k=top_k,
+        max_size=max_size,
+        processes=processes or os.cpu_count(),
+    )
+    store.put_party_suggestions(steam_id, groups)
+    return groups
@@ -0,0 +1,86 @@
+"""Size-based dispatch of CPU-heavy jobs to a shared process pool.
+
+Small jobs run inline. Large ones run in a pool of worker processes, so they
+don't hold the request process's GIL while other requests wait. Workers read
+libraries straight from the shared SQLite store instead of receiving them.
+"""
+
+import asyncio
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import TypeVar
+
+# Owned-game rows in a party above which ranking leaves the request process
+OFFLOAD_MIN_SIZE = int(os.getenv("OFFLOAD_MIN_SIZE", "50000"))
+OFFLOAD_PROCESSES = int(os.getenv("OFFLOAD_PROCESSES", "2"))
+
+T = TypeVar("T")
+
+_pool: ProcessPoolExecutor | None = None
+_pool_pid: int | None = None
+_lock = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Return this process's pool, creating it on first use.
+
+    Workers are spawned rather than forked, since the request process runs
+    threads, and are created per pid like the HTTP client.
+    """
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(
+                max_workers=OFFLOAD_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+@atexit.register
+def shutdown_pool() -> None:
+    global _pool
+    with _lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def run_sized(size: int, fn: Callable[..., T], *args) -> T:
+    """Call `fn(*args)` in the pool if `size` reaches OFFLOAD_MIN_SIZE.
+
+    `fn` and its arguments must be picklable. A broken pool is replaced and
+    the job run inline.
+    """
+    if size < OFFLOAD_MIN_SIZE or OFFLOAD_PROCESSES < 1:
+        return fn(*args)
+
+    try:
+        return get_pool().submit(fn, *args).result()
+    except BrokenProcessPool:
+        logging.warning("Offload pool broke, running inline", extra={"size": size})
+        shutdown_pool()
+        return fn(*args)
+
+
+async def run_sized_async(size: int, fn: Callable[..., T], *args) -> T:
+    """`run_sized` for the event loop; small jobs run in a thread instead."""
+    if size < OFFLOAD_MIN_SIZE or OFFLOAD_PROCESSES < 1:
+        return await asyncio.to_thread(fn, *args)
+
+    try:
+        return await asyncio.wrap_future(get_pool().submit(fn, *args))
+    except BrokenProcessPool:
+        logging.warning("Offload pool broke, running inline", extra={"size": size})
+        shutdown_pool()
+        return await asyncio.to_thread(fn, *args)
@@ -0,0 +1,23 @@
+from collections.abc import Iterable, Mapping
+from itertools import chain
+
+
+def build_bitsets(libraries: Mapping[str, Iterable[int]]) -> dict[str, int]:
+    """Encode libraries as int bitsets over one shared appid index.
+
+    The games two users share is then `(a & b).bit_count()`.
+    """
+    index = {
+        appid: bit
+        for bit, appid in enumerate(
+            sorted(set(chain.from_iterable(libraries.values())))
+        )
+    }
+    bitsets = {}
+    for user_id, library in libraries.items():
+        bits = bytearray((len(index) + 7) // 8)
+        for appid in library:
+            bit = index[appid]
+            bits[bit >> 3] |= 1 << (bit & 7)
+        bitsets[user_id] = int.from_bytes(bits, "little")
+    return bitsets
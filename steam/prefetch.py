@@ -0,0 +1,88 @@
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from flask import Flask, current_app
+
+from steam import (
+    STEAM_RATE_LIMIT_FILE,
+    daily_budget,
+    get_owned_games,
+    is_owned_games_cached,
+    rate_limiter,
+)
+from steam.ratelimit import TokenBucket
+
+PREFETCH_CALLS_PER_SECOND = 1.0  # Budget for background Steam calls, host-wide
+PREFETCH_RESERVE = 0.4  # Share of the shared burst left to interactive requests
+PREFETCH_DAILY_RESERVE = 0.5  # Share of the daily budget prefetch never touches
+PREFETCH_BACKOFF = 0.5  # Seconds between checks while the shared bucket is low
+PREFETCH_QUEUE_SIZE = 2_000
+
+# Shared by every worker process on the host, like `rate_limiter`
+_bucket = TokenBucket(
+    PREFETCH_CALLS_PER_SECOND, 1, path=f"{STEAM_RATE_LIMIT_FILE}-prefetch"
+)
+
+_queue: queue.Queue[tuple[Flask, str, int, str]] = queue.Queue(PREFETCH_QUEUE_SIZE)
+_generations: defaultdict[str, int] = defaultdict(int)
+_lock = threading.Lock()
+_worker: threading.Thread | None = None
+
+
+def prefetch_owned_games(owner_id: str, steam_ids: list[str]) -> None:
+    """Warm the owned-games cache for `steam_ids` in the background.
+
+    Any prefetch still queued for `owner_id` is superseded by this one.
+    """
+    app = current_app._get_current_object()  # type: ignore[attr-defined]
+    with _lock:
+        _generations[owner_id] += 1
+        generation = _generations[owner_id]
+    _ensure_worker()
+
+    for steam_id in steam_ids:
+        try:
+            _queue.put_nowait((app, owner_id, generation, steam_id))
+        except queue.Full:
+            break
+
+
+def cancel_prefetch(owner_id: str) -> None:
+    with _lock:
+        _generations[owner_id] += 1
+
+
+def _ensure_worker() -> None:
+    global _worker
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="steam-prefetch", daemon=True)
+            _worker.start()
+
+
+def _run() -> None:
+    while True:
+        app, owner_id, generation, steam_id = _queue.get()
+        if _generations[owner_id] != generation:
+            continue
+
+        with app.app_context():
+            if is_owned_games_cached(steam_id):
+                continue
+            if daily_budget.remaining() < PREFETCH_DAILY_RESERVE * daily_budget.limit:
+                continue
+
+            # Prefetch only spends what interactive requests leave over
+            _bucket.acquire()
+            while rate_limiter.tokens() < PREFETCH_RESERVE * rate_limiter.capacity:
+                time.sleep(PREFETCH_BACKOFF)
+            try:
+                get_owned_games(steam_id)
+            except Exception as e:
+                logging.warning(
+                    "Prefetch of owned games failed",
+                    extra={"steam_id": steam_id, "exception": str(e)},
+                )
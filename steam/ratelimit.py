@@ -0,0 +1,196 @@
+import asyncio
+import fcntl
+import json
+import os
+import threading
+import time
+from collections.abc import Awaitable, Callable, Hashable
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from typing import Any, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+def _update_file(path: str, update: Callable[[dict | None], tuple[dict, T]]) -> T:
+    """Apply `update` to the JSON state in `path` under an exclusive flock.
+
+    `update` gets the current state, or None if there is none yet, and
+    returns the new state and a result to hand back.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        with os.fdopen(os.dup(fd), "r+") as state_file:
+            try:
+                state = json.load(state_file)
+            except ValueError:
+                state = None
+            state, result = update(state if isinstance(state, dict) else None)
+            state_file.seek(0)
+            state_file.truncate()
+            json.dump(state, state_file)
+        return result
+    finally:
+        os.close(fd)
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second, holding up to `capacity`.
+
+    With `path` set, the bucket state lives in that file behind an flock so
+    every process on the host draws from the same budget.
+    """
+
+    def __init__(self, rate: float, capacity: float, path: str | None = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.path = path
+        self._lock = threading.Lock()
+        self._tokens = capacity
+        self._updated = time.time()
+
+    def acquire(self) -> None:
+        while True:
+            wait = self._try_take()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        while True:
+            # The file-backed state takes an flock, so keep it off the event loop
+            wait = await asyncio.to_thread(self._try_take)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def tokens(self) -> float:
+        """Tokens in the bucket right now, without taking one."""
+        return self._update(take=False)
+
+    def _try_take(self) -> float:
+        """Take a token and return 0, or return the seconds until one is available."""
+        return self._update(take=True)
+
+    def _update(self, take: bool) -> float:
+        """Refill the bucket, then take a token or just count them.
+
+        With `take` this returns what `_try_take` does, otherwise the tokens.
+        """
+        with self._lock:
+            if self.path is None:
+                self._tokens, self._updated, result = self._refill(
+                    self._tokens, self._updated, take
+                )
+                return result
+
+            def update(state: dict | None) -> tuple[dict, float]:
+                if state and "tokens" in state and "updated" in state:
+                    tokens, updated = state["tokens"], state["updated"]
+                else:
+                    tokens, updated = self.capacity, time.time()
+                tokens, updated, result = self._refill(tokens, updated, take)
+                return {"tokens": tokens, "updated": updated}, result
+
+            return _update_file(self.path, update)
+
+    def _refill(
+        self, tokens: float, updated: float, take: bool
+    ) -> tuple[float, float, float]:
+        now = time.time()
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        if not take:
+            return tokens, now, tokens
+        if tokens >= 1:
+            return tokens - 1, now, 0.0
+        return tokens, now, (1 - tokens) / self.rate
+
+
+class DailyBudget:
+    """At most `limit` calls per UTC day, shared through `path` like `TokenBucket`."""
+
+    def __init__(self, limit: int, path: str | None = None):
+        self.limit = limit
+        self.path = path
+        self._lock = threading.Lock()
+        self._state: dict[str, Any] = {}
+
+    def try_spend(self) -> bool:
+        """Count one call, or return False if today's budget is already spent."""
+        return self._update(spend=True)
+
+    def remaining(self) -> int:
+        return self._update(spend=False)
+
+    def _update(self, spend: bool) -> Any:
+        def update(state: dict | None) -> tuple[dict, Any]:
+            today = datetime.now(timezone.utc).date().isoformat()
+            used = state["used"] if state and state.get("day") == today else 0
+            if not spend:
+                return {"day": today, "used": used}, max(self.limit - used, 0)
+            if used >= self.limit:
+                return {"day": today, "used": used}, False
+            return {"day": today, "used": used + 1}, True
+
+        with self._lock:
+            if self.path is None:
+                self._state, result = update(self._state)
+                return result
+            return _update_file(self.path, update)
+
+
+class SingleFlight(Generic[T]):
+    """Collapse concurrent calls sharing a key into one in-flight call."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, Future[T]] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if future is None:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class AsyncSingleFlight(Generic[T]):
+    """`SingleFlight` for coroutines running on one event loop."""
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Future[T]] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        future = self._calls.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception retrieved when nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
@@ -0,0 +1,557 @@
+"""Persistent SQLite store for Steam profiles, libraries and prices.
+
+The database runs in WAL mode so every worker process on the host can read
+and write it concurrently, and it survives restarts. Every row carries the
+time it was fetched from Steam; readers pass the maximum age they accept.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Iterable
+
+STEAM_STORE_PATH = os.getenv(
+    "STEAM_STORE_PATH",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ".cache",
+        "steam.sqlite3",
+    ),
+)
+SQLITE_BUSY_TIMEOUT = 30.0  # Seconds to wait on a write lock held elsewhere
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    steamid TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+-- When a user last logged in or loaded their friends, see `recent_players`
+CREATE TABLE IF NOT EXISTS activity (
+    steamid TEXT PRIMARY KEY,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS activity_last_seen ON activity (last_seen);
+-- When each user's friends list was last fetched, see `get_friends`
+CREATE TABLE IF NOT EXISTS friend_lists (
+    owner TEXT PRIMARY KEY,
+    fetched_at REAL NOT NULL
+);
+-- The friends of `owner` in Steam's order; their profiles live in `players`
+CREATE TABLE IF NOT EXISTS friendships (
+    owner TEXT NOT NULL,
+    friend TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (owner, friend)
+) WITHOUT ROWID;
+-- One row per fetched library; game_count is NULL when the library is private
+CREATE TABLE IF NOT EXISTS libraries (
+    steamid TEXT PRIMARY KEY,
+    game_count INTEGER,
+    version TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS owned_games (
+    steamid TEXT NOT NULL,
+    appid INTEGER NOT NULL,
+    playtime_forever INTEGER NOT NULL DEFAULT 0,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (steamid, appid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS owned_games_appid ON owned_games (appid);
+CREATE TABLE IF NOT EXISTS apps (
+    appid INTEGER PRIMARY KEY,
+    name TEXT,
+    img_icon_url TEXT,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS prices (
+    appid INTEGER NOT NULL,
+    country TEXT NOT NULL,
+    price TEXT,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (appid, country)
+) WITHOUT ROWID;
+-- Friend groups of `owner` that share the most games, see `steam.groups`
+CREATE TABLE IF NOT EXISTS party_suggestions (
+    owner TEXT NOT NULL,
+    members TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    common_games INTEGER NOT NULL,
+    computed_at REAL NOT NULL,
+    PRIMARY KEY (owner, members)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS share_links (
+    id TEXT PRIMARY KEY,
+    token TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+_local = threading.local()
+_schema_pid: int | None = None
+_schema_lock = threading.Lock()
+
+
+def connection() -> sqlite3.Connection:
+    """Return this thread's connection, creating the schema once per process."""
+    global _schema_pid
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+
+    os.makedirs(os.path.dirname(STEAM_STORE_PATH), exist_ok=True)
+    conn = sqlite3.connect(STEAM_STORE_PATH, timeout=SQLITE_BUSY_TIMEOUT)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    # SQLite's own lower() only folds ASCII; rankings sort names like Python
+    conn.create_function("py_lower", 1, _lower, deterministic=True)
+    with _schema_lock:
+        if _schema_pid != os.getpid():
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                conn.executescript(SCHEMA)
+            _schema_pid = os.getpid()
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+def _lower(value: str | None) -> str | None:
+    return None if value is None else value.lower()
+
+
+def _placeholders(values: list) -> str:
+    return ",".join("?" * len(values))
+
+
+def get_players(steam_ids: list[str], max_age: float) -> dict[str, dict]:
+    if not steam_ids:
+        return {}
+    rows = connection().execute(
+        f"SELECT steamid, summary FROM players"
+        f" WHERE steamid IN ({_placeholders(steam_ids)}) AND fetched_at >= ?",
+        [*steam_ids, time.time() - max_age],
+    )
+    return {steam_id: json.loads(summary) for steam_id, summary in rows}
+
+
+def put_players(players: dict[str, dict]) -> None:
+    now = time.time()
+    with connection() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO players (steamid, summary, fetched_at)"
+            " VALUES (?, ?, ?)",
+            [(sid, json.dumps(player), now) for sid, player in players.items()],
+        )
+
+
+def mark_seen(steam_id: str) -> None:
+    with connection() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO activity (steamid, last_seen) VALUES (?, ?)",
+            [steam_id, time.time()],
+        )
+
+
+def recent_players(limit: int) -> list[str]:
+    """The `limit` users seen most recently, by login or friends list load."""
+    rows = connection().execute(
+        "SELECT steamid FROM activity ORDER BY last_seen DESC LIMIT ?", [limit]
+    )
+    return [steam_id for (steam_id,) in rows]
+
+
+def get_friends(owner: str, max_age: float) -> tuple[list[dict], float] | None:
+    """`owner`'s friends as {"player": {...}} dicts, and when they were fetched."""
+    conn = connection()
+    friend_list = conn.execute(
+        "SELECT fetched_at FROM friend_lists WHERE owner = ? AND fetched_at >= ?",
+        (owner, time.time() - max_age),
+    ).fetchone()
+    if friend_list is None:
+        return None
+    rows = conn.execute(
+        "SELECT p.summary FROM friendships f JOIN players p ON p.steamid = f.friend"
+        " WHERE f.owner = ? ORDER BY f.position",
+        (owner,),
+    )
+    return [{"player": json.loads(summary)} for (summary,) in rows], friend_list[0]
+
+
+def put_friends(owner: str, friend_ids: list[str]) -> None:
+    """Replace `owner`'s friends; their profiles must already be in `players`."""
+    with connection() as conn:
+        conn.execute("DELETE FROM friendships WHERE owner = ?", (owner,))
+        conn.executemany(
+            "INSERT OR REPLACE INTO friendships (owner, friend, position)"
+            " VALUES (?, ?, ?)",
+            [(owner, friend, position) for position, friend in enumerate(friend_ids)],
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO friend_lists (owner, fetched_at) VALUES (?, ?)",
+            (owner, time.time()),
+        )
+
+
+def delete_friends(owner: str) -> None:
+    with connection() as conn:
+        conn.execute("DELETE FROM friendships WHERE owner = ?", (owner,))
+        conn.execute("DELETE FROM friend_lists WHERE owner = ?", (owner,))
+
+
+def has_library(steam_id: str, max_age: float) -> bool:
+    row = (
+        connection()
+        .execute(
+            "SELECT 1 FROM libraries WHERE steamid = ? AND fetched_at >= ?",
+            (steam_id, time.time() - max_age),
+        )
+        .fetchone()
+    )
+    return row is not None
+
+
+def library_fetched_at(steam_ids: list[str]) -> dict[str, float]:
+    """When each stored library was last fetched, however old."""
+    if not steam_ids:
+        return {}
+    rows = connection().execute(
+        f"SELECT steamid, fetched_at FROM libraries"
+        f" WHERE steamid IN ({_placeholders(steam_ids)})",
+        steam_ids,
+    )
+    return dict(rows.fetchall())
+
+
+def get_library(steam_id: str, max_age: float) -> dict | None:
+    """Rebuild a GetOwnedGames `response` payload from the stored rows."""
+    conn = connection()
+    library = conn.execute(
+        "SELECT game_count FROM libraries WHERE steamid = ? AND fetched_at >= ?",
+        (steam_id, time.time() - max_age),
+    ).fetchone()
+    if library is None:
+        return None
+    if library[0] is None:
+        return {}
+
+    rows = conn.execute(
+        "SELECT o.appid, a.name, a.img_icon_url, o.playtime_forever"
+        " FROM owned_games o LEFT JOIN apps a USING (appid)"
+        " WHERE o.steamid = ?",
+        (steam_id,),
+    )
+    games = [
+        {
+            "appid": appid,
+            "name": name,
+            "img_icon_url": img_icon_url,
+            "playtime_forever": playtime_forever,
+        }
+        for appid, name, img_icon_url, playtime_forever in rows
+    ]
+    return {"game_count": library[0], "games": games}
+
+
+def library_appids(steam_id: str) -> set[int] | None:
+    """The stored appids of a user, or None if their library was never stored."""
+    conn = connection()
+    if (
+        conn.execute(
+            "SELECT 1 FROM libraries WHERE steamid = ?", (steam_id,)
+        ).fetchone()
+        is None
+    ):
+        return None
+    rows = conn.execute("SELECT appid FROM owned_games WHERE steamid = ?", (steam_id,))
+    return {appid for (appid,) in rows}
+
+
+def unknown_apps(app_ids: list[int]) -> set[int]:
+    """The appids that have no name/icon row in `apps` yet."""
+    if not app_ids:
+        return set()
+    rows = connection().execute(
+        f"SELECT appid FROM apps WHERE appid IN ({_placeholders(app_ids)})", app_ids
+    )
+    return set(app_ids) - {appid for (appid,) in rows}
+
+
+def put_library(steam_id: str, owned_games: dict) -> bool:
+    """Store a GetOwnedGames payload as a delta against the stored library.
+
+    Only added, removed and re-played rows are written. The library's version
+    token, which keys cached party results, only changes when the set of owned
+    appids (or the library's visibility) changed. Returns whether it did.
+    """
+    now = time.time()
+    games = owned_games.get("games")
+    incoming = {game["appid"]: game.get("playtime_forever", 0) for game in games or []}
+
+    with connection() as conn:
+        # Take the write lock before reading, so a concurrent writer of the same
+        # library can't insert the rows diffed as added here in between
+        conn.execute("BEGIN IMMEDIATE")
+        library = conn.execute(
+            "SELECT game_count, version FROM libraries WHERE steamid = ?", (steam_id,)
+        ).fetchone()
+        stored = dict(
+            conn.execute(
+                "SELECT appid, playtime_forever FROM owned_games WHERE steamid = ?",
+                (steam_id,),
+            ).fetchall()
+        )
+
+        added = incoming.keys() - stored.keys()
+        removed = stored.keys() - incoming.keys()
+        replayed = [
+            (playtime, now, steam_id, appid)
+            for appid, playtime in incoming.items()
+            if appid in stored and stored[appid] != playtime
+        ]
+        changed = (
+            library is None
+            or (library[0] is None) != (games is None)
+            or bool(added or removed)
+        )
+
+        if removed:
+            conn.executemany(
+                "DELETE FROM owned_games WHERE steamid = ? AND appid = ?",
+                [(steam_id, appid) for appid in removed],
+            )
+        if added:
+            conn.executemany(
+                "INSERT INTO owned_games"
+                " (steamid, appid, playtime_forever, fetched_at) VALUES (?, ?, ?, ?)",
+                [(steam_id, appid, incoming[appid], now) for appid in added],
+            )
+            put_apps(
+                [
+                    game
+                    for game in games or []
+                    if game["appid"] in added and "name" in game
+                ],
+                conn,
+            )
+        if replayed:
+            conn.executemany(
+                "UPDATE owned_games SET playtime_forever = ?, fetched_at = ?"
+                " WHERE steamid = ? AND appid = ?",
+                replayed,
+            )
+        conn.execute(
+            "INSERT OR REPLACE INTO libraries (steamid, game_count, version, fetched_at)"
+            " VALUES (?, ?, ?, ?)",
+            (
+                steam_id,
+                None if games is None else len(games),
+                uuid.uuid4().hex if changed else library[1],
+                now,
+            ),
+        )
+    return changed
+
+
+def put_apps(games: Iterable[dict], conn: sqlite3.Connection | None = None) -> None:
+    """Store app names and icons, in `conn`'s open transaction if given."""
+    if conn is None:
+        with connection() as conn:
+            return put_apps(games, conn)
+
+    now = time.time()
+    conn.executemany(
+        "INSERT OR REPLACE INTO apps (appid, name, img_icon_url, fetched_at)"
+        " VALUES (?, ?, ?, ?)",
+        [
+            (game["appid"], game.get("name"), game.get("img_icon_url"), now)
+            for game in games
+        ],
+    )
+
+
+def get_apps(app_ids: list[int]) -> list[tuple[int, str | None, str | None]]:
+    if not app_ids:
+        return []
+    rows = connection().execute(
+        f"SELECT appid, name, img_icon_url FROM apps"
+        f" WHERE appid IN ({_placeholders(app_ids)})",
+        app_ids,
+    )
+    return rows.fetchall()
+
+
+def library_appids_many(steam_ids: list[str]) -> dict[str, list[int]]:
+    """The owned appids of every stored library among `steam_ids`, however old."""
+    if not steam_ids:
+        return {}
+    conn = connection()
+    in_clause = f"IN ({_placeholders(steam_ids)})"
+    libraries: dict[str, list[int]] = {
+        steam_id: []
+        for (steam_id,) in conn.execute(
+            f"SELECT steamid FROM libraries WHERE steamid {in_clause}", steam_ids
+        )
+    }
+    rows = conn.execute(
+        f"SELECT steamid, appid FROM owned_games WHERE steamid {in_clause}", steam_ids
+    )
+    for steam_id, appid in rows:
+        libraries[steam_id].append(appid)
+    return libraries
+
+
+def owned_games_count(steam_ids: list[str]) -> int:
+    if not steam_ids:
+        return 0
+    row = (
+        connection()
+        .execute(
+            f"SELECT count(*) FROM owned_games"
+            f" WHERE steamid IN ({_placeholders(steam_ids)})",
+            steam_ids,
+        )
+        .fetchone()
+    )
+    return row[0]
+
+
+def library_versions(steam_ids: list[str]) -> dict[str, str]:
+    if not steam_ids:
+        return {}
+    rows = connection().execute(
+        f"SELECT steamid, version FROM libraries"
+        f" WHERE steamid IN ({_placeholders(steam_ids)})",
+        steam_ids,
+    )
+    return dict(rows.fetchall())
+
+
+def mark_players_stale(steam_ids: list[str]) -> None:
+    """Make the profiles and libraries of the given users due for a refetch.
+
+    The rows themselves are kept, so a stale library is still refreshed as a
+    delta against what is stored.
+    """
+    if not steam_ids:
+        return
+    in_clause = f"IN ({_placeholders(steam_ids)})"
+    with connection() as conn:
+        conn.execute(
+            f"UPDATE players SET fetched_at = 0 WHERE steamid {in_clause}", steam_ids
+        )
+        conn.execute(
+            f"UPDATE libraries SET fetched_at = 0 WHERE steamid {in_clause}", steam_ids
+        )
+
+
+def common_games(
+    steam_ids: list[str], min_owners: int, limit: int | None = None
+) -> list[tuple[int, list[str]]]:
+    """Every appid owned by at least `min_owners` of `steam_ids`, with its owners.
+
+    Ranked by owner count, then name. A qualifying appid must be in at least
+    one of any `len(steam_ids) - min_owners + 1` libraries, so candidates are
+    taken from that many of the smallest libraries only; the rest are never
+    aggregated. With a `limit`, only the top `limit` appids are returned.
+    """
+    if not steam_ids:
+        return []
+    in_clause = f"IN ({_placeholders(steam_ids)})"
+    rows = connection().execute(
+        f"WITH smallest AS ("
+        f" SELECT steamid FROM libraries WHERE steamid {in_clause}"
+        f" ORDER BY coalesce(game_count, 0) LIMIT ?"
+        f"), candidates AS ("
+        f" SELECT DISTINCT appid FROM owned_games WHERE steamid IN smallest"
+        f")"
+        f" SELECT o.appid, group_concat(o.steamid) FROM owned_games o"
+        f" JOIN candidates USING (appid) LEFT JOIN apps a USING (appid)"
+        f" WHERE o.steamid {in_clause}"
+        f" GROUP BY o.appid HAVING count(*) >= ?"
+        f" ORDER BY count(*) DESC, py_lower(coalesce(a.name, '')), o.appid"
+        f" LIMIT ?",
+        [
+            *steam_ids,
+            max(len(steam_ids) - min_owners + 1, 0),
+            *steam_ids,
+            min_owners,
+            -1 if limit is None else limit,
+        ],
+    )
+    return [(appid, owners.split(",")) for appid, owners in rows]
+
+
+def get_prices(
+    app_ids: list[int], country: str, max_age: float
+) -> dict[int, str | None]:
+    if not app_ids:
+        return {}
+    rows = connection().execute(
+        f"SELECT appid, price FROM prices"
+        f" WHERE appid IN ({_placeholders(app_ids)}) AND country = ?"
+        f" AND fetched_at >= ?",
+        [*app_ids, country, time.time() - max_age],
+    )
+    return dict(rows.fetchall())
+
+
+def put_prices(prices: dict[int, str | None], country: str) -> None:
+    now = time.time()
+    with connection() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO prices (appid, country, price, fetched_at)"
+            " VALUES (?, ?, ?, ?)",
+            [(app_id, country, price, now) for app_id, price in prices.items()],
+        )
+
+
+def put_share_link(link_id: str, token: str) -> None:
+    with connection() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO share_links (id, token, created_at) VALUES (?, ?, ?)",
+            (link_id, token, time.time()),
+        )
+
+
+def get_share_link(link_id: str) -> str | None:
+    row = (
+        connection()
+        .execute("SELECT token FROM share_links WHERE id = ?", (link_id,))
+        .fetchone()
+    )
+    return row[0] if row else None
+
+
+def put_party_suggestions(owner: str, groups: list[tuple[list[str], int]]) -> None:
+    """Replace `owner`'s suggested groups with `(members, common games)` pairs."""
+    now = time.time()
+    with connection() as conn:
+        conn.execute("DELETE FROM party_suggestions WHERE owner = ?", (owner,))
+        conn.executemany(
+            "INSERT OR REPLACE INTO party_suggestions"
+            " (owner, members, size, common_games, computed_at) VALUES (?, ?, ?, ?, ?)",
+            [
+                (owner, ",".join(members), len(members), common_games, now)
+                for members, common_games in groups
+            ],
+        )
+
+
+def get_party_suggestions(owner: str, limit: int = 10) -> list[dict]:
+    rows = connection().execute(
+        "SELECT members, common_games, computed_at FROM party_suggestions"
+        " WHERE owner = ? ORDER BY common_games DESC, size DESC LIMIT ?",
+        (owner, limit),
+    )
+    return [
+        {
+            "members": members.split(","),
+            "common_games": common_games,
+            "computed_at": computed_at,
+        }
+        for members, common_games, computed_at in rows
+    ]
@@ -0,0 +1,39 @@
+"""Load what the store knows about recently active players into memory.
+
+Nothing is fetched from Steam. Run on worker boot by `run.warm_start`, so the
+first requests after a deploy don't find this process's caches empty.
+"""
+
+from collections import Counter
+
+from steam import PRICE_CACHE_MAXSIZE, PRICE_CACHE_TIMEOUT, _batches, price_cache, store
+from steam.catalog import apps
+from steam.client import get_client
+
+WARM_START_BATCH_SIZE = 500  # Ids per store query, well below SQLite's limit
+WARM_START_MAX_LIBRARIES = 5_000
+
+
+def preload(steam_ids: list[str], country: str = "US") -> dict[str, int]:
+    """Fill the app catalog and `price_cache` from the libraries of `steam_ids`.
+
+    Only the first `WARM_START_MAX_LIBRARIES` ids are read. The most widely
+    owned apps come first and are capped at the price cache's size.
+    """
+    get_client()
+    libraries = 0
+    owners: Counter[int] = Counter()
+    for batch in _batches(steam_ids[:WARM_START_MAX_LIBRARIES], WARM_START_BATCH_SIZE):
+        for library in store.library_appids_many(batch).values():
+            owners.update(library)
+            libraries += 1
+    app_ids = [appid for appid, _ in owners.most_common(PRICE_CACHE_MAXSIZE)]
+
+    prices = 0
+    for batch in _batches(app_ids, WARM_START_BATCH_SIZE):
+        apps.get_many(batch)
+        stored = store.get_prices(batch, country, max_age=PRICE_CACHE_TIMEOUT)
+        for app_id, price in stored.items():
+            price_cache.set((app_id, country), price)
+        prices += len(stored)
+    return {"libraries": libraries, "apps": len(app_ids), "prices": prices}
@@ -0,0 +1,14 @@
+import threading
+
+import pytest
+
+from steam import store
+
+
+@pytest.fixture
+def steam_store(tmp_path, monkeypatch):
+    """The store, backed by a fresh database for this test."""
+    monkeypatch.setattr(store, "STEAM_STORE_PATH", str(tmp_path / "steam.sqlite3"))
+    monkeypatch.setattr(store, "_local", threading.local())
+    monkeypatch.setattr(store, "_schema_pid", None)
+    return store
@@ -0,0 +1,56 @@
+import base64
+import json
+
+import pytest
+
+from sharing import STEAM_ID64_BASE, InvalidShareToken, decode_party, encode_party
+
+ALICE = str(STEAM_ID64_BASE + 12)
+BOB = str(STEAM_ID64_BASE + 7)
+CAROL = str(STEAM_ID64_BASE + 2**32 - 1)
+
+
+def test_round_trip_sorts_and_dedups():
+    token = encode_party([ALICE, BOB, CAROL, ALICE])
+    assert decode_party(token) == [BOB, ALICE, CAROL]
+
+
+def test_same_party_same_token():
+    assert encode_party([ALICE, BOB]) == encode_party([BOB, ALICE, BOB])
+
+
+def test_empty_party():
+    assert decode_party(encode_party([])) == []
+
+
+def test_legacy_json_token():
+    token = base64.urlsafe_b64encode(
+        json.dumps({"friend_ids": [ALICE, BOB]}).encode()
+    ).decode()
+    assert decode_party(token) == [ALICE, BOB]
+
+
+@pytest.mark.parametrize("steam_ids", [["not a number"], ["1"], [str(2**64)]])
+def test_unencodable_party(steam_ids):
+    with pytest.raises(InvalidShareToken):
+        encode_party(steam_ids)
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        "",
+        "!!!",
+        "A",
+        # Unknown version byte
+        base64.urlsafe_b64encode(b"\x02\x00\x00\x00\x01").decode(),
+        # Truncated account id
+        base64.urlsafe_b64encode(b"\x01\x00\x00\x01").decode(),
+        base64.urlsafe_b64encode(b"{not json").decode(),
+        base64.urlsafe_b64encode(b'{"friend_ids": "1"}').decode(),
+        base64.urlsafe_b64encode(b"[1, 2]").decode(),
+    ],
+)
+def test_malformed_token(token):
+    with pytest.raises(InvalidShareToken):
+        decode_party(token)
@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+NAMES = ["Alpha", "alpha", "beta", "Éclair", "éclair", "Ölands", "omega", "Zed"]
+APP_IDS = range(80)
+
+
+def brute_force_common_games(libraries, names, min_owners):
+    owners: dict[int, list[str]] = {}
+    for steam_id, appids in libraries.items():
+        for appid in appids:
+            owners.setdefault(appid, []).append(steam_id)
+    return sorted(
+        (appid for appid, members in owners.items() if len(members) >= min_owners),
+        key=lambda appid: (
+            -len(owners[appid]),
+            (names.get(appid) or "").lower(),
+            appid,
+        ),
+    ), owners
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_common_games_matches_brute_force(steam_store, seed):
+    rng = random.Random(seed)
+    # Some apps have no name, which ranks like an empty one
+    names = {appid: rng.choice(NAMES) for appid in APP_IDS if rng.random() < 0.9}
+    steam_store.put_apps(
+        {"appid": appid, "name": name, "img_icon_url": ""}
+        for appid, name in names.items()
+    )
+
+    for party in range(15):
+        steam_ids = [f"{seed}_{party}_{i}" for i in range(rng.randint(1, 7))]
+        libraries: dict[str, set[int]] = {}
+        for steam_id in steam_ids:
+            if rng.random() < 0.15:
+                # A private library
+                steam_store.put_library(steam_id, {})
+                libraries[steam_id] = set()
+                continue
+            appids = set(rng.sample(APP_IDS, rng.randint(0, 40)))
+            steam_store.put_library(
+                steam_id,
+                {
+                    "game_count": len(appids),
+                    "games": [
+                        {"appid": appid, "playtime_forever": 0} for appid in appids
+                    ],
+                },
+            )
+            libraries[steam_id] = appids
+
+        min_owners = rng.randint(2, len(steam_ids) + 1)
+        expected, owners = brute_force_common_games(libraries, names, min_owners)
+
+        ranked = steam_store.common_games(steam_ids, min_owners)
+        assert [appid for appid, _ in ranked] == expected
+        for appid, members in ranked:
+            assert sorted(members) == sorted(owners[appid])
+
+        limit = rng.randint(0, 10)
+        ranked = steam_store.common_games(steam_ids, min_owners, limit)
+        assert [appid for appid, _ in ranked] == expected[:limit]